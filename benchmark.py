@@ -0,0 +1,217 @@
+import json
+import numpy as np
+import os
+import subprocess
+import sys
+import tracemalloc
+
+from argparse import ArgumentParser
+from dmd_segmentation import DMD, RDMD, StreamingDMD
+from dmd_segmentation.frames import normalize_frame
+from dmd_segmentation.synthetic import moving_blobs
+from itertools import product
+from logging import basicConfig, getLogger, INFO
+from time import perf_counter
+
+
+STAGES = ["update", "_tsvd", "residuals", "modes", "reconstruct", "__call__"]
+# optional dependencies which must not be loaded by importing the package or its entry point
+HEAVY_MODULES = ["cv2", "PIL", "pandas", "matplotlib", "tqdm"]
+IMPORT_SCRIPT = """
+import json, sys, time
+t = time.perf_counter()
+import dmd_segmentation, dmd_segmentation.cli
+t = time.perf_counter() - t
+print(json.dumps({"seconds": t, "loaded": [m for m in json.loads(sys.argv[1]) if m in sys.modules]}))
+"""
+
+
+def cold(m, func):
+    # every stage is timed from an empty decomposition cache
+    def stage(x):
+        m._invalidate()
+        return func(x)
+    return stage
+
+
+def stage_funcs(m, max_hist):
+    def reconstruct(x):
+        res, modes, amps = m.residuals
+        return m.reconstruct(m._Q @ modes[:, :1], amps[:1], [max_hist])
+
+    funcs = {
+        "_tsvd": lambda x: m._tsvd(),
+        "residuals": lambda x: m.residuals,
+        "modes": lambda x: m.modes,
+        "__call__": lambda x: m(x),
+    }
+    if isinstance(m, StreamingDMD):
+        funcs["reconstruct"] = reconstruct
+    return {name: cold(m, func) for name, func in funcs.items()}
+
+
+def make_model(cls, max_hist, max_rank):
+    if cls == "StreamingDMD":
+        return StreamingDMD(max_hist=max_hist, max_rank=max_rank)
+    if cls == "DMD":
+        return DMD(max_rank=max_rank, max_hist=max_hist)
+    return RDMD(random_rank=max_rank, oversampling=max_rank)
+
+
+def run_case(cls, frames, max_hist, max_rank, repeat):
+    m = make_model(cls, max_hist, max_rank)
+    times = {stage: [] for stage in STAGES}
+    streaming = cls == "StreamingDMD"
+    funcs = None
+    for k in range(len(frames) - 1):
+        x, y = frames[k], frames[k + 1]
+        if streaming and k > max_hist:
+            # the history is filled, time the per-frame stages
+            funcs = funcs or stage_funcs(m, max_hist)
+            for name, func in funcs.items():
+                t = perf_counter()
+                func(x)
+                times[name].append(perf_counter() - t)
+        t = perf_counter()
+        m.update(x, y)
+        times["update"].append(perf_counter() - t)
+
+    if not streaming:
+        # offline methods are queried once after all snapshots are collected
+        funcs = stage_funcs(m, max_hist)
+        for _ in range(repeat):
+            for name, func in funcs.items():
+                t = perf_counter()
+                func(frames[-1])
+                times[name].append(perf_counter() - t)
+
+    return {stage: float(np.mean(ts)) for stage, ts in times.items() if ts}
+
+
+def peak_memory(cls, frames, max_hist, max_rank):
+    tracemalloc.start()
+    m = make_model(cls, max_hist, max_rank)
+    for k in range(len(frames) - 1):
+        m.update(frames[k], frames[k + 1])
+        if cls == "StreamingDMD" and k > 0:
+            m.residuals
+    if cls != "StreamingDMD":
+        m.residuals
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def import_time(repeat):
+    # fastest of repeated cold imports of the package and the CLI in fresh interpreters, as a spawned worker sees them
+    # the interpreters run next to this script, so the package is found from any working directory
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT, json.dumps(HEAVY_MODULES)],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if out.returncode != 0:
+            return {"error": out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f"exit code {out.returncode}"}
+        runs.append(json.loads(out.stdout))
+    return min(runs, key=lambda r: r["seconds"])
+
+
+def check_import(budget, repeat):
+    logger = getLogger("Benchmark")
+    result = import_time(repeat)
+    if "error" in result:
+        logger.warning(f"REGRESSION    |    importing the package fails: {result['error']}")
+        return 1
+    logger.info(f"IMPORT    |    dmd_segmentation, dmd_segmentation.cli: {result['seconds']:.3f} s, budget {budget:.3f} s")
+    failures = 0
+    if result["loaded"]:
+        logger.warning(f"REGRESSION    |    importing the package loads {', '.join(result['loaded'])}")
+        failures += 1
+    if result["seconds"] > budget:
+        logger.warning(f"REGRESSION    |    import takes {result['seconds']:.3f} s, budget {budget:.3f} s")
+        failures += 1
+    return failures
+
+
+def compare(records, baseline, tolerance):
+    logger = getLogger("Benchmark")
+    key = lambda r: (r["class"], tuple(r["resolution"]), r["max_hist"], r["max_rank"], r["stage"])  # noqa: E731
+    reference = {key(r): r for r in baseline}
+    regressions = 0
+    for r in records:
+        ref = reference.get(key(r))
+        if ref is None:
+            continue
+        if r["fps"] < ref["fps"] / (1. + tolerance):
+            logger.warning(f"REGRESSION    |    {key(r)}: {r['fps']:10.1f} fps, baseline {ref['fps']:10.1f} fps")
+            regressions += 1
+        if r["peak_memory"] > ref["peak_memory"] * (1. + tolerance):
+            logger.warning(f"REGRESSION    |    {key(r)}: peak memory {r['peak_memory']} B, baseline {ref['peak_memory']} B")
+            regressions += 1
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(
+        prog='Benchmark',
+        description='Time the hot paths of DMD, RDMD and Streaming DMD on synthetic frames.'
+    )
+    parser.add_argument("--classes", nargs="+", choices=["StreamingDMD", "DMD", "RDMD"], default=["StreamingDMD", "DMD", "RDMD"])
+    parser.add_argument("--resolutions", nargs="+", default=["120x160", "240x320"])
+    parser.add_argument("--max-hists", nargs="+", type=int, default=[5, 10, 20])
+    parser.add_argument("--max-ranks", nargs="+", type=int, default=[5])
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--background", choices=["static", "oscillating"], default="oscillating")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", default=None, help="write the results as JSON lines")
+    parser.add_argument("--compare", default=None, help="JSON lines baseline to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--import-budget", type=float, default=0.5, help="maximal seconds to import the package and the CLI, 0 skips the check")
+    args = parser.parse_args()
+    basicConfig(level=INFO)
+
+    # checked first, the import must not depend on anything the benchmarks load
+    import_failures = check_import(args.import_budget, args.repeat) if args.import_budget > 0 else 0
+
+    records = []
+    for resolution in args.resolutions:
+        shape = tuple(int(s) for s in resolution.split("x"))
+        frames = np.array([normalize_frame(f) for f in moving_blobs(shape, args.frames, background=args.background)])
+        for cls, max_hist, max_rank in product(args.classes, args.max_hists, args.max_ranks):
+            times = run_case(cls, frames, max_hist, max_rank, args.repeat)
+            peak = peak_memory(cls, frames, max_hist, max_rank)
+            for stage, t in times.items():
+                records.append({
+                    "class": cls,
+                    "resolution": list(shape),
+                    "max_hist": max_hist,
+                    "max_rank": max_rank,
+                    "stage": stage,
+                    "seconds": t,
+                    "fps": 1. / t,
+                    "peak_memory": peak,
+                })
+
+    print(f"{'class':>12} {'resolution':>10} {'hist':>5} {'rank':>5} {'stage':>12} {'fps':>12} {'peak MiB':>9}")
+    for r in records:
+        res = "x".join(str(s) for s in r["resolution"])
+        print(f"{r['class']:>12} {res:>10} {r['max_hist']:>5} {r['max_rank']:>5} {r['stage']:>12} {r['fps']:>12.1f} {r['peak_memory'] / 2**20:>9.2f}")
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            for r in records:
+                f.write(json.dumps(r) + "\n")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = [json.loads(line) for line in f if line.strip()]
+        if compare(records, baseline, args.tolerance):
+            raise SystemExit(1)
+
+    if import_failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,44 @@
-from .video import Video                                            # noqa: F401
-from .images import Image                                           # noqa: F401
-from .dmd import DMD, RDMD                                          # noqa: F401
-from .streaming_dmd import StreamingDMD                             # noqa: F401
+from importlib import import_module
+
+
+# Public names and the modules defining them. They are imported on first access, so that importing the
+# package (e.g. in the workers of a sweep) does not load OpenCV or Pillow until a Video or Image is used.
+_EXPORTS = {
+    "Video": ".video",
+    "Image": ".images",
+    "DMD": ".dmd",
+    "RDMD": ".dmd",
+    "StreamingRDMD": ".dmd",
+    "StreamingDMD": ".streaming_dmd",
+    "SnapshotBuffer": ".snapshots",
+    "StreamingQR": ".qr",
+    "LowRankOperator": ".lowrank",
+    "SweepConfig": ".sweep",
+    "run_sweep": ".sweep",
+    "pipeline": ".streams",
+    "run_pipeline": ".streams",
+    "FrameCache": ".frame_cache",
+    "IncrementalSVD": ".isvd",
+    "StreamingDMDBank": ".bank",
+    "TiledStreamingDMD": ".tiles",
+    "PyramidStreamingDMD": ".pyramid",
+    "MaskStore": ".masks",
+}
+_SUBMODULES = ["profiling", "evaluation"]
+
+__all__ = list(_EXPORTS) + _SUBMODULES
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(import_module(_EXPORTS[name], __name__), name)
+    elif name in _SUBMODULES:
+        value = import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,158 @@
+import numpy as np
+
+from logging import getLogger, INFO
+from scipy.linalg import get_blas_funcs
+
+
+class StreamingDMDBank:
+    def __init__(self, num_streams, max_hist, max_rank=None, num_reorth=3):
+        # N independent streaming DMDs with a shared max_hist and max_rank whose QR factors are stacked,
+        # so that every step is a handful of batched operations instead of N small ones
+        self.logger = getLogger("StreamingDMDBank")
+        self.logger.setLevel(INFO)
+
+        assert max_hist is not None and max_hist > 1
+        self.num_streams = num_streams
+        self.max_hist = max_hist
+        self.max_rank = max_rank
+        self.num_reorth = num_reorth
+        self._Qt = None # the columns of Q are stored as rows to keep them contiguous
+        self._R = None
+        self._oldest = None # Q coordinates of the oldest x snapshot once it has left the QR factors
+        self._k = 0
+        self._len = 0
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _append(self, y):
+        if self._Qt is None:
+            cap = self.max_hist + 1
+            self._Qt = np.zeros((self.num_streams, cap, y.shape[1]), dtype=np.float64)
+            self._gemv, self._rot = get_blas_funcs(("gemv", "rot"), (self._Qt,))
+            self._R = np.zeros((self.num_streams, cap, cap), dtype=np.float64)
+            self._oldest = np.zeros((self.num_streams, cap - 1), dtype=np.float64)
+
+        k = self._k
+        # work directly in the new row of Qt, which also converts y to float64
+        self._Qt[:, k] = y
+        y_o = self._R[:, :k, k]
+        y_o[:] = 0.
+        # Reorthonormalize one stream at a time, so each basis stays in cache for all passes
+        if k > 0:
+            for stream, Qt in enumerate(self._Qt):
+                # the transposed rows are a Fortran ordered (n, k) basis, which BLAS takes without copying
+                Q, y_diff = Qt[:k].T, Qt[k]
+                for _ in range(self.num_reorth):
+                    py = self._gemv(1., Q, y_diff, trans=1)
+                    y_o[stream] += py
+                    self._gemv(-1., Q, py, beta=1., y=y_diff, overwrite_y=True)
+        nqy = np.linalg.norm(self._Qt[:, k], axis=1)
+        self._Qt[:, k] /= nqy[:, np.newaxis]
+        self._R[:, k, k] = nqy
+        self._k += 1
+
+    def _delete(self):
+        # Drop the leading column with one batched Givens rotation per row pair of the small R
+        k = self._k
+        R = self._R[:, :k, :k]
+        cs = np.empty((k - 1, 2, self.num_streams))
+        for i in range(1, k):
+            a, b = R[:, i - 1, i], R[:, i, i]
+            r = np.hypot(a, b)
+            safe = np.where(r > 0, r, 1.)
+            c = cs[i - 1, 0] = np.where(r > 0, a / safe, 1.)
+            s = cs[i - 1, 1] = np.where(r > 0, b / safe, 0.)
+            # the rotations also act on the dropped column, which yields the coordinates of the oldest snapshot
+            upper, lower = R[:, i - 1].copy(), R[:, i].copy()
+            R[:, i - 1] = c[:, np.newaxis] * upper + s[:, np.newaxis] * lower
+            R[:, i] = c[:, np.newaxis] * lower - s[:, np.newaxis] * upper
+        # Q is rotated in place one stream at a time, so each basis stays in cache for all of its rotations
+        for stream, Qt in enumerate(self._Qt):
+            for i in range(1, k):
+                self._rot(Qt[i - 1], Qt[i], cs[i - 1, 0, stream], cs[i - 1, 1, stream], overwrite_x=True, overwrite_y=True)
+        self._oldest[:, :k - 1] = R[:, :k - 1, 0]
+        R[:, :k - 1, :k - 1] = R[:, :k - 1, 1:].copy()
+        R[:, :, k - 1] = 0.
+        R[:, k - 1, :] = 0.
+        self._k -= 1
+
+    def update(self, X, Y):
+        # X, Y: one (x, y) pair per stream, stacked as rows
+        assert X.shape[0] == self.num_streams and Y.shape[0] == self.num_streams
+        if self._k == 0:
+            self._append(X)
+        self._append(Y)
+        self._len = min(self._len + 1, self.max_hist)
+        if self._k > self.max_hist:
+            self._delete()
+        self._cache = {}
+
+    @property
+    def _Q(self):
+        return self._Qt[:, :self._k].swapaxes(1, 2)
+
+    @property
+    def R(self):
+        return self._R[:, :self._k, :self._k]
+
+    def _tsvd(self):
+        def compute():
+            _U, _S, _Vh = np.linalg.svd(self.R[:, :, :-1], full_matrices=False)
+            if self.max_rank is not None:
+                _U = _U[:, :, :self.max_rank]
+                _S = _S[:, :self.max_rank]
+                _Vh = _Vh[:, :self.max_rank, :]
+            return _U, _Vh.conj().swapaxes(1, 2) / _S[:, np.newaxis, :]
+        return self._cached("tsvd", compute)
+
+    @property
+    def residuals(self):
+        # Per stream residuals (sorted), eigenvectors in Q coordinates and eigenvalues
+        def compute():
+            _U, V_S_inv = self._tsvd()
+            _YV = self.R[:, :, 1:] @ V_S_inv
+            _A = _U.conj().swapaxes(1, 2) @ _YV
+            evals, evecs = np.linalg.eig(_A)
+            residuals = np.linalg.norm(_YV @ evecs - (_U @ evecs) * evals[:, np.newaxis, :], axis=1)
+            P = np.argsort(residuals, axis=1)
+            evecs = np.take_along_axis(evecs, P[:, np.newaxis, :], axis=2)
+            return np.take_along_axis(residuals, P, axis=1), _U @ evecs, np.take_along_axis(evals, P, axis=1)
+        return self._cached("residuals", compute)
+
+    def _QhX(self):
+        if self._k - 1 < self._len:
+            return np.concatenate([self._oldest[:, :self._k, np.newaxis], self.R[:, :, :-1]], axis=2)
+        return self.R[:, :, :-1]
+
+    def background(self, x_index=None, eig_threshold=5e-3):
+        if x_index is None:
+            x_index = self._len
+
+        def compute():
+            _, coords, amps = self.residuals
+            logamps = np.log(amps.astype(np.cdouble)) # this avoids nan problems
+            mask = np.abs(logamps) < eig_threshold
+            mask[~mask.any(axis=1), 0] = True
+            vander = np.where(mask, amps ** x_index, 0.)
+
+            # Amplitudes of the selected modes, unselected ones are decoupled and solved to zero
+            _Ch = coords.conj().swapaxes(1, 2)
+            gram = (_Ch @ coords) * (vander.conj()[:, :, np.newaxis] * vander[:, np.newaxis, :])
+            rhs = vander.conj() * (_Ch @ self._QhX()).sum(axis=2)
+            gram = np.where(mask[:, :, np.newaxis] & mask[:, np.newaxis, :], gram, np.eye(gram.shape[1]))
+            alpha = np.linalg.solve(gram, rhs[:, :, np.newaxis])[:, :, 0]
+
+            b = (coords @ (alpha * vander)[:, :, np.newaxis])[:, :, 0].real
+            return b / np.linalg.norm(b, axis=1, keepdims=True)
+        b = self._cached(("background", x_index, eig_threshold), compute)
+        return (self._Q @ b[:, :, np.newaxis])[:, :, 0]
+
+    def foreground(self, X, x_index=None, eig_threshold=5e-3):
+        return np.abs(X - self.background(x_index, eig_threshold))
+
+    def __len__(self):
+        return self._len
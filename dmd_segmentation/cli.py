@@ -0,0 +1,131 @@
+import json
+
+from . import profiling
+from .evaluation import score_many
+from .images import Image
+from .sweep import SweepConfig, run_sweep
+from .writers import MaskWriter
+from argparse import ArgumentParser
+from itertools import chain
+from logging import basicConfig, getLogger, INFO
+from os import makedirs
+from os.path import join
+
+
+MODES = {"motion": "Motion", "fg": "Foreground"}
+
+
+def load_config(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def sweep_configs(dataset, modes):
+    # (mode, SweepConfig) of every history length and mode, motion detection has no tolerance
+    configs = []
+    for mode in modes:
+        if mode not in dataset["modes"]:
+            continue
+        params = dataset["modes"][mode]
+        tols = params.get("tols", [None] * len(dataset["hist_lens"]))
+        for hist_len, tol in zip(dataset["hist_lens"], tols):
+            config = SweepConfig(hist_len, dataset.get("max_rank", 5), tol, params["eig_threshold"], params["mask_threshold"])
+            configs.append((mode, config))
+    return configs
+
+
+def source(dataset):
+    if dataset.get("source", "images") == "video":
+        from .video import Video
+        return Video(), dataset["path"]
+    return Image(), dataset.get("path", join(dataset["sequence"], "input"))
+
+
+def run_dataset(dataset, output, modes, output_dir=".", cache_dir=None, max_workers=None):
+    logger = getLogger("Detection")
+    name = dataset["name"]
+    start_frame = dataset.get("start_frame", 0)
+    reader, path = source(dataset)
+    cache = None if cache_dir is None else join(cache_dir, f"{name}.frames")
+    # decoded once straight into the memory shared by the sweep, all modes and history lengths share the frames
+    num_frames = reader.num_frames(path, start_frame)
+    frames = reader.stream(path, start_frame=start_frame, cache=cache)
+    # the reader knows the resolution once the first frame is decoded
+    frames = chain([next(frames)], frames)
+    configs = sweep_configs(dataset, modes)
+    logger.info(f"DATASET    |    {name}: {num_frames} frames, {len(configs)} configurations")
+    # configs with the same history length share one StreamingDMD across the modes
+    with profiling.stage("sweep"):
+        results = run_sweep(frames, [config for _, config in configs], max_workers=max_workers, progress=True, resolution=reader.resolution, num_frames=num_frames)
+
+    for mode in modes:
+        selected = [(index, config) for index, (m, config) in enumerate(configs) if m == mode]
+        if not selected:
+            continue
+        hist_lens = [config.max_hist for _, config in selected]
+        ress = results["min_ress"][[index for index, _ in selected]]
+        prefix = join(output_dir, f"{name}_{mode}")
+
+        if output in ("matrices", "all"):
+            import pandas as pd
+            pd.DataFrame(ress.T).to_csv(f"{prefix}_res.csv", header=hist_lens, index_label="index")
+            if "sequence" in dataset:
+                # the first foreground belongs to the frame after start_frame, CDnet numbers frames from 1
+                masks = {config: results["fgs"][config] for _, config in selected}
+                with profiling.stage("score"):
+                    scores = score_many(masks, dataset["sequence"], start_frame + 2)
+                pd.DataFrame([scores[config] for _, config in selected], index=hist_lens).to_csv(f"{prefix}_scores.csv", index_label="hist_len")
+
+        if output in ("gifs", "all"):
+            for _, config in selected:
+                with MaskWriter(f"{prefix}_hist_{config.max_hist}.gif", reader.resolution, fps=30, threshold=config.mask_threshold) as writer:
+                    writer.write_many(results["fgs"][config])
+
+        if output in ("plots", "all"):
+            import matplotlib.pyplot as plt
+            plt.figure()
+            plt.semilogy(ress.T)
+            plt.title(f"DMD Residuals for {dataset.get('title', name)} {MODES[mode]} Detection")
+            plt.xlabel("Frame")
+            plt.ylabel("Residual")
+            plt.legend(hist_lens)
+            plt.savefig(f"{prefix}_res.png")
+            plt.show()
+
+
+def main(argv=None):
+    parser = ArgumentParser(
+        prog='python -m dmd_segmentation',
+        description='Motion and foreground detection with Streaming DMD on the datasets of a config file.'
+    )
+    parser.add_argument("--config", default="configs/cdnet.json")
+    parser.add_argument("--output", choices=["all", "gifs", "plots", "matrices", "none"], default="none")
+    parser.add_argument("--datasets", nargs="+", default=None, help="names of the datasets to run, all by default")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--cache-dir", default=None, help="frame cache directory, overrides the config, pass an empty string to disable")
+    parser.add_argument("--max-workers", type=int, default=None)
+    parser.add_argument("--profile", default=None, help="write the per-stage timings and counters as JSON lines")
+    parser.add_argument("--profile-calls", default=None, help="also write one record per profiled call, CSV for .csv and JSON lines otherwise")
+    args = parser.parse_args(argv)
+    basicConfig(level=INFO)
+
+    config = load_config(args.config)
+    cache_dir = config.get("cache_dir") if args.cache_dir is None else (args.cache_dir or None)
+    output_dir = config.get("output_dir", ".")
+    makedirs(output_dir, exist_ok=True)
+    if args.profile is not None:
+        profiling.enable(sink=args.profile_calls)
+
+    for dataset in config["datasets"]:
+        if args.datasets is not None and dataset["name"] not in args.datasets:
+            continue
+        run_dataset(dataset, args.output, args.modes, output_dir, cache_dir, args.max_workers)
+
+    if args.profile is not None:
+        profiler = profiling.disable()
+        print(profiler.format_summary())
+        profiler.to_jsonl(args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import numpy as np
+
+from .masks import MaskStore
+from .profiling import count
+from .streaming_dmd import StreamingDMD
+
+
+def stream_detect_many(pairs, max_hist, max_rank=5, modes=[(None, 5e-3)], model=None, dtype=np.float64):
+    # Foreground (tol given) or motion (tol is None) detection for several (tol, eig_threshold) modes
+    # sharing one StreamingDMD, the backgrounds of equal eig_thresholds are computed once
+    # Yields (minimal residual, [foreground or None per mode]) for every pair after the first one
+    m_str = model if model is not None else StreamingDMD(max_rank=max_rank, max_hist=max_hist, dtype=dtype)
+    bgs = [None] * len(modes)
+    for iter, (x, y) in enumerate(pairs):
+        if iter > 0:
+            # identify background modes
+            res = m_str.residuals[0]
+            fgs = []
+            for k, (tol, eig_threshold) in enumerate(modes):
+                fg = None
+                if tol is None or np.min(res) < tol: # last background reconstruction is reliable
+                    bgs[k] = m_str.background(max_hist, eig_threshold)
+
+                    if tol is None:
+                        fg = np.abs(x - bgs[k])
+                elif bgs[k] is not None: # last background reconstruction is unreliable, detect foreground!
+                    fg = np.abs(x - bgs[k])
+                fgs.append(fg)
+
+            count("frames")
+            yield np.min(res), fgs
+
+        m_str.update(x, y)
+
+
+def stream_detect(pairs, max_hist, max_rank=5, tol=None, eig_threshold=5e-3, model=None, dtype=np.float64):
+    # Foreground (tol given) or motion (tol is None) detection on a stream of (x, y) pairs
+    # Yields (minimal residual, foreground or None) for every pair after the first one
+    # model replaces the default StreamingDMD, e.g. by a TiledStreamingDMD for high resolution frames
+    for res, fgs in stream_detect_many(pairs, max_hist, max_rank, [(tol, eig_threshold)], model=model, dtype=dtype):
+        yield res, fgs[0]
+
+
+def detect_many(frames, max_hist, max_rank=5, modes=[(None, 5e-3, None)], resolution=None):
+    # Run the detection loop of the scripts for several (tol, eig_threshold, mask_threshold) modes at once
+    # With a mask_threshold the foregrounds of a mode are collected as bit packed masks in a MaskStore
+    # Returns one (residuals, foregrounds) per mode, the residuals are shared
+    pairs = zip(frames[:-1], frames[1:])
+    ress = 1e-16 * np.ones(len(frames) - 2)
+    results = [[] if mask_threshold is None else MaskStore(resolution or (len(frames[0]),), mask_threshold) for _, _, mask_threshold in modes]
+    for iter, (res, fgs) in enumerate(stream_detect_many(pairs, max_hist, max_rank, [mode[:2] for mode in modes])):
+        ress[iter] = res
+        for (_, _, mask_threshold), result, fg in zip(modes, results, fgs):
+            if fg is None:
+                continue
+            if mask_threshold is None:
+                result.append(fg)
+            else:
+                result.append(fg, iter)
+
+    for k, (_, _, mask_threshold) in enumerate(modes):
+        if mask_threshold is None:
+            results[k] = np.array(results[k]) if results[k] else np.empty((0, len(frames[0])))
+    return [(ress, result) for result in results]
+
+
+def detect(frames, max_hist, max_rank=5, tol=None, eig_threshold=5e-3, mask_threshold=None, resolution=None):
+    # Run the detection loop of the scripts on a stack of normalized frames
+    # With mask_threshold the foregrounds are collected as bit packed masks in a MaskStore
+    return detect_many(frames, max_hist, max_rank, [(tol, eig_threshold, mask_threshold)], resolution)[0]
@@ -1,25 +1,53 @@
 import numpy as np
 
+from .lowrank import LowRankOperator, as_precision
+from .profiling import count, profiled, stage
+from .snapshots import SnapshotBuffer
+from collections import namedtuple
 from logging import getLogger, INFO
-from scipy.linalg import svd
+from scipy.linalg import cholesky, lstsq, qr, solve_triangular, svd, LinAlgError
+
+
+Analysis = namedtuple("Analysis", ["U", "V_S_inv", "A", "evals", "evecs", "residuals"])
 
 
 class DMD:
-    def __init__(self, max_rank=None):
+    def __init__(self, max_rank=None, max_hist=None, dtype=np.float64):
+        # dtype is the precision of the snapshots and of all pixel space products,
+        # the small SVDs, eigendecompositions and solves always run in double precision
         self.logger = getLogger("DMD")
         self.logger.setLevel(INFO)
         
         self.max_rank = max_rank
-        self._X = []
-        self._Y = []
-        self._len = 0
+        self.max_hist = max_hist
+        self.dtype = np.dtype(dtype)
+        self._X = SnapshotBuffer(max_hist)
+        self._Y = SnapshotBuffer(max_hist)
+        self._cache = {}
 
+    @profiled("update")
     def update(self, x, y):
-        self._X.append(x)
-        self._Y.append(y)
-        self._len += 1
+        self._X.append(self._cast(x))
+        self._Y.append(self._cast(y))
+        self._invalidate()
+
+    def _cast(self, x):
+        return as_precision(x, self.dtype)
+
+    def _invalidate(self):
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
 
     def _tsvd(self):
+        return self._cached("tsvd", self._compute_tsvd)
+
+    @profiled("_tsvd")
+    def _compute_tsvd(self):
+        count("svd")
         _U, _S, _Vh = svd(self.X, full_matrices=False)
         if self.max_rank is not None:
             _U = _U[:, :self.max_rank]
@@ -28,111 +56,227 @@ class DMD:
 
         return _U, (1. / _S) * _Vh.conj().T
 
+    @property
+    def _reduced_Y(self):
+        # Y in the coordinates in which the truncated SVD was computed
+        return self.Y
+
+    def _lift(self, coords):
+        return coords
+
+    def _project(self, x):
+        return x
+
+    def _reduced_YV(self):
+        return self._cached("YV", lambda: self._reduced_Y @ self._tsvd()[1])
+
+    def analyze(self):
+        return self._cached("analysis", self._compute_analysis)
+
+    def _compute_analysis(self):
+        # the truncated SVD is timed as its own stage, before the eig stage starts
+        _U, V_S_inv = self._tsvd()
+        with stage("eig"):
+            _Y = self._reduced_Y
+            _A = as_precision((_U.conj().T @ _Y) @ V_S_inv, np.float64)
+            evals, evecs = np.linalg.eig(_A)
+            residuals = np.linalg.norm(_Y @ as_precision(V_S_inv @ evecs, _Y.dtype) - (_U @ as_precision(evecs, _U.dtype)) * evals, axis=0)
+        return Analysis(_U, V_S_inv, _A, evals, evecs, residuals)
+
     @property
     def X(self):
-        return np.array(self._X).T
+        return self._X.view
 
     @property
     def Y(self):
-        return np.array(self._Y).T
+        return self._Y.view
     
     @property
     def A(self):
-        _U, V_S_inv = self._tsvd()
-        return (_U.conj().T @ self.Y) @ V_S_inv
+        return self.analyze().A
     
     @property
     def modes(self):
-        _U, V_S_inv = self._tsvd()
-        _A = (_U.conj().T @ self.Y) @ V_S_inv
-        evals, evecs = np.linalg.eig(_A)
-        return _U @ evecs, evals
+        return self._cached("modes", self._compute_modes)
+
+    def _compute_modes(self):
+        analysis = self.analyze()
+        return self._lift(analysis.U @ as_precision(analysis.evecs, analysis.U.dtype)), analysis.evals
     
     @property
     def residuals(self):
-        _U, V_S_inv = self._tsvd()
-        _A = (_U.conj().T @ self.Y) @ V_S_inv
-        evals, evecs = np.linalg.eig(_A)
-        residuals = np.linalg.norm(self.Y @ (V_S_inv @ evecs) - (_U @ evecs) * evals, axis=0)
-        return residuals, _U @ evecs, evals
+        analysis = self.analyze()
+        modes, evals = self.modes
+        return analysis.residuals, modes, evals
     
+    @property
+    def operator(self):
+        return self._cached("operator", self._compute_operator)
+
+    def _compute_operator(self):
+        _U, _ = self._tsvd()
+        _YV = self._reduced_YV()
+        return LowRankOperator(_YV, np.eye(_YV.shape[1], dtype=_YV.dtype), _U)
+
     def __call__(self, x):
-        _U, V_S_inv = self._tsvd()
-        _A = self.Y @ V_S_inv
+        return self.operator(x)
+
+    def predict_many(self, X, steps=1):
+        # Predict the snapshots `steps` frames after each column of X
+        if steps == 1:
+            return self.operator(X)
+
+        # K^s = (Y V S^-1) A^(s-1) U^H with A^(s-1) applied through its eigendecomposition
+        analysis = self.analyze()
+        Z = np.linalg.solve(analysis.evecs, analysis.U.conj().T @ self._project(X))
+        Z = (analysis.evals ** (steps - 1)).reshape((-1, 1)) * Z
+        _YV = self._reduced_YV()
+        pred = self._lift(_YV @ as_precision(analysis.evecs @ Z, _YV.dtype))
+        if np.isrealobj(X) and np.isrealobj(analysis.A):
+            pred = pred.real
+        return pred
 
-        return _A @ (_U.conj().T @ x)
+    def prediction_error_many(self, X, Y, relative=True, steps=1):
+        errors = np.linalg.norm(Y - self.predict_many(X, steps=steps), axis=0)
+        if relative:
+            errors /= np.linalg.norm(Y, axis=0)
+        return errors
     
     def __len__(self):
-        return self._len
+        return len(self._X)
     
 
 class RDMD(DMD):
-    def __init__(self, random_rank, oversampling, num_reorth=3):
-        super().__init__(max_rank=random_rank)
+    def __init__(self, random_rank, oversampling, num_reorth=3, seed=None, orthonormalization="householder", dtype=np.float64):
+        super().__init__(max_rank=random_rank, dtype=dtype)
         self.logger = getLogger("RDMD")
         self.logger.setLevel(INFO)
 
+        assert orthonormalization in ("householder", "cholqr2")
+        self.orthonormalization = orthonormalization
+
         self.total_rank = random_rank + oversampling
         self.random_rank = random_rank
         self.oversampling = oversampling
         self.num_reorth = num_reorth
+        self._rng = np.random.default_rng(seed)
         self._Q = None
         self._Omega = None
         self.compressed = False
 
+    @profiled("update")
     def update(self, x, y):
         super().update(x, y)
         if self._Omega is None:
-            self._Omega = np.zeros((x.shape[0], self.total_rank))
-        self._Omega += np.outer(x, np.random.randn(self.total_rank))
+            self._Omega = np.zeros((x.shape[0], self.total_rank), dtype=self.dtype)
+        self._Omega += np.outer(self._cast(x), self._rng.standard_normal(self.total_rank).astype(self.dtype))
+
+    def _orthonormalize(self, Omega):
+        # Blocked orthonormalization of the sketch, the columns are signed like Gram-Schmidt (positive diagonal of R)
+        if self.orthonormalization == "cholqr2":
+            try:
+                Q = Omega
+                for _ in range(2):
+                    L = cholesky(Q.conj().T @ Q, lower=True)
+                    Q = solve_triangular(L, Q.conj().T, lower=True).conj().T
+                return Q
+            except LinAlgError:
+                self.logger.info("CHOLQR2    |    Sketch is too ill-conditioned, falling back to Householder QR")
+        Q, R = qr(Omega, mode="economic", check_finite=False)
+        signs = np.sign(np.diag(R))
+        signs[signs == 0] = 1.
+        return Q * signs
 
+    @profiled("compress")
     def _compress(self):
-        self._Omega += np.outer(self._Y[-1], np.random.randn(self.total_rank))
-        self._Q = np.zeros(self._Omega.shape)
-        v = self._Omega[:, 0]
-        nv = np.linalg.norm(v)
-        self._Q[:, 0] = v / nv
-        for i in range(1, self._Omega.shape[1]):
-            v = self._Omega[:, i]
-            v_o = np.zeros((i, 1))
-            for _ in range(self.num_reorth):
-                dv = (self._Q[:, :i].conj().T @ v).reshape(-1, 1)
-                v_o += dv
-                v -= np.squeeze(self._Q[:, :i] @ dv)
-            nv = np.linalg.norm(v)
-            self._Q[:, i] = v / nv
+        self._Omega += np.outer(self._Y[-1], self._rng.standard_normal(self.total_rank).astype(self.dtype))
+        self._Q = self._orthonormalize(self._Omega)
         _Qh = self._Q.conj().T
-        self._X = [ _Qh @ x for x in self._X ]
-        self._Y = [ _Qh @ y for y in self._Y ]
+        # the reduced snapshots are small, they are kept in double precision
+        self._X = SnapshotBuffer.from_array(as_precision(_Qh @ self.X, np.float64))
+        self._Y = SnapshotBuffer.from_array(as_precision(_Qh @ self.Y, np.float64))
         self.compressed = True
+        self._invalidate()
 
     def _tsvd(self):
         if not self.compressed:
             self._compress()
         return super()._tsvd()
-    
-    @property
-    def modes(self):
-        if not self.compressed:
-            self._compress()
-        modes, evals = super().modes
-        return self._Q @ modes, evals
-    
-    @property
-    def residuals(self):
-        if not self.compressed:
-            self._compress()
 
-        _U, V_S_inv = self._tsvd()
-        _A = (_U.conj().T @ self.Y) @ V_S_inv
+    def _lift(self, coords):
+        return self._Q @ as_precision(coords, self._Q.dtype)
 
-        evals, evecs = np.linalg.eig(_A)
-        residuals = np.linalg.norm(self.Y @ (V_S_inv @ evecs) - (_U @ evecs) * evals, axis=0) # no need to project back, because self._Q has orthonormal columns
-        return residuals, self._Q @ (_U @ evecs), evals
+    def _project(self, x):
+        return self._Q.conj().T @ self._cast(x)
     
-    def __call__(self, x):
-        _U, V_S_inv = self._tsvd()
-        _A = self.Y @ V_S_inv
+    def _compute_operator(self):
+        _U, _ = self._tsvd()
+        return LowRankOperator(self._Q, self._reduced_YV() @ _U.conj().T, self._Q)
+
 
-        return self._Q @ (_A @ _U.conj().T @ (self._Q.conj().T @ x))
-    
\ No newline at end of file
+class StreamingRDMD(RDMD):
+    def __init__(self, random_rank, oversampling, num_reorth=3, seed=None, sketch_size=None, test_matrix="sparse_sign", sparsity=8, orthonormalization="householder", dtype=np.float64):
+        # Single pass RDMD: only the range sketch X G (n x total_rank), the co-range sketches Phi X and Phi Y
+        # (sketch_size x T) and the last y are kept. The coordinates Q^H X are recovered from Phi X = (Phi Q) Q^H X.
+        # With test_matrix="sparse_sign" every snapshot touches `sparsity` columns of the range sketch
+        # and Phi has `sparsity` nonzeros per column, "gaussian" uses dense test matrices.
+        super().__init__(random_rank, oversampling, num_reorth=num_reorth, seed=seed, orthonormalization=orthonormalization, dtype=dtype)
+        self.logger = getLogger("StreamingRDMD")
+        self.logger.setLevel(INFO)
+
+        assert test_matrix in ("sparse_sign", "gaussian")
+        self.test_matrix = test_matrix
+        self.sparsity = min(sparsity, self.total_rank)
+        self.sketch_size = 2 * self.total_rank + 1 if sketch_size is None else sketch_size
+        assert self.sketch_size >= self.total_rank
+        self._Phi = None
+        self._last_y = None
+        self._last_g = self._rng.standard_normal(self.total_rank)
+        self._PhiX = SnapshotBuffer()
+        self._PhiY = SnapshotBuffer()
+
+    def _co_range_matrix(self, n):
+        if self.test_matrix == "gaussian":
+            return (self._rng.standard_normal((self.sketch_size, n)) / np.sqrt(self.sketch_size)).astype(self.dtype)
+        from scipy.sparse import csr_matrix
+        zeta = min(self.sparsity, self.sketch_size)
+        rows = np.argsort(self._rng.random((n, self.sketch_size)), axis=1)[:, :zeta].ravel()
+        cols = np.repeat(np.arange(n), zeta)
+        signs = self._rng.choice([-1., 1.], size=n * zeta) / np.sqrt(zeta)
+        return csr_matrix((signs.astype(self.dtype), (rows, cols)), shape=(self.sketch_size, n))
+
+    @profiled("update")
+    def update(self, x, y):
+        x, y = self._cast(x), self._cast(y)
+        if self._Omega is None:
+            # columns are contiguous for the sparse sign updates
+            self._Omega = np.zeros((x.shape[0], self.total_rank), dtype=self.dtype, order="F")
+            self._Phi = self._co_range_matrix(x.shape[0])
+
+        if self.test_matrix == "gaussian":
+            self._Omega += np.outer(x, self._rng.standard_normal(self.total_rank).astype(self.dtype))
+        else:
+            columns = self._rng.choice(self.total_rank, size=self.sparsity, replace=False)
+            signs = self._rng.choice([-1., 1.], size=self.sparsity)
+            for column, sign in zip(columns, signs):
+                self._Omega[:, column] += sign * x
+        self._PhiX.append(self._Phi @ x)
+        self._PhiY.append(self._Phi @ y)
+        self._last_y = y
+        self.compressed = False
+        self._invalidate()
+
+    @profiled("compress")
+    def _compress(self):
+        # the sketch itself is left untouched so that the stream can continue afterwards
+        self._Q = self._orthonormalize(self._Omega + np.outer(self._last_y, self._last_g.astype(self.dtype)))
+        _PhiQ = as_precision(self._Phi @ self._Q, np.float64)
+        coords = lstsq(_PhiQ, as_precision(np.hstack([self._PhiX.view, self._PhiY.view]), np.float64))[0]
+        T = len(self._PhiX)
+        self._X = SnapshotBuffer.from_array(coords[:, :T])
+        self._Y = SnapshotBuffer.from_array(coords[:, T:])
+        self.compressed = True
+        self._invalidate()
+
+    def __len__(self):
+        return len(self._PhiX)
@@ -0,0 +1,102 @@
+import numpy as np
+
+from .frames import prefetch
+from concurrent.futures import ThreadPoolExecutor
+from os.path import exists, join
+
+
+# CDnet ground truth labels, hard shadows count as background, outside ROI and unknown pixels are ignored
+STATIC = 0
+SHADOW = 50
+OUTSIDE_ROI = 85
+UNKNOWN = 170
+MOTION = 255
+
+COUNTS = ["tp", "fp", "fn", "tn"]
+
+
+def confusion(masks, gts):
+    # (..., 4) counts of true/false positives/negatives of boolean masks against ground truth labels
+    masks = np.asarray(masks, dtype=bool)
+    gts = np.asarray(gts)
+    positive = gts == MOTION
+    negative = (gts == STATIC) | (gts == SHADOW)
+    axes = tuple(range(-2, 0))
+    return np.stack([
+        np.count_nonzero(masks & positive, axis=axes),
+        np.count_nonzero(masks & negative, axis=axes),
+        np.count_nonzero(~masks & positive, axis=axes),
+        np.count_nonzero(~masks & negative, axis=axes),
+    ], axis=-1)
+
+
+def metrics(counts):
+    # The CDnet measures of (..., 4) confusion counts, frames without positives give nan recall
+    counts = np.asarray(counts, dtype=np.float64)
+    tp, fp, fn, tn = np.moveaxis(counts, -1, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recall = tp / (tp + fn)
+        precision = tp / (tp + fp)
+        return {
+            "recall": recall,
+            "specificity": tn / (tn + fp),
+            "fpr": fp / (fp + tn),
+            "fnr": fn / (tp + fn),
+            "pwc": 100. * (fn + fp) / (tp + fn + fp + tn),
+            "precision": precision,
+            "f_measure": 2. * precision * recall / (precision + recall),
+        }
+
+
+def temporal_roi(sequence):
+    # First and last frame number with ground truth of a CDnet sequence folder
+    filename = join(sequence, "temporalROI.txt")
+    if not exists(filename):
+        return None
+    with open(filename) as f:
+        first, last = (int(v) for v in f.read().split()[:2])
+    return first, last
+
+
+def load_ground_truth(sequence, numbers, num_workers=4, queue_size=16):
+    # Ground truth label images of the given frame numbers, decoded on a thread pool
+    from PIL import Image as pim
+    filenames = (join(sequence, "groundtruth", f"gt{number:06d}.png") for number in numbers)
+    return prefetch(filenames, lambda filename: np.asarray(pim.open(filename).convert("L")), num_workers, queue_size)
+
+
+def evaluate(masks, sequence, first_frame, indices=None, batch_size=64, num_workers=4):
+    # Per frame confusion counts of masks against the ground truth of a CDnet sequence folder.
+    # Mask i belongs to frame number first_frame + indices[i] (indices default to masks.indices or 0, 1, ...),
+    # for detect with start_frame s this is first_frame = s + 2. Frames outside the temporal ROI are skipped.
+    # Returns (frame numbers, (frames, 4) counts).
+    if indices is None:
+        indices = getattr(masks, "indices", None) or range(len(masks))
+    numbers = first_frame + np.asarray(indices)
+    roi = temporal_roi(sequence)
+    selected = np.arange(len(numbers)) if roi is None else np.flatnonzero((numbers >= roi[0]) & (numbers <= roi[1]))
+
+    counts = np.zeros((len(selected), 4), dtype=np.int64)
+    gts = load_ground_truth(sequence, numbers[selected], num_workers=num_workers)
+    for start in range(0, len(selected), batch_size):
+        batch = selected[start:start + batch_size]
+        gt = np.array([next(gts) for _ in batch])
+        pred = np.asarray(masks[batch] if hasattr(masks, "packed") else [masks[i] for i in batch])
+        counts[start:start + len(batch)] = confusion(pred.reshape(gt.shape), gt)
+    return numbers[selected], counts
+
+
+def score(masks, sequence, first_frame, **kwargs):
+    # Sequence level measures, computed from the summed confusion counts like the CDnet evaluation
+    _, counts = evaluate(masks, sequence, first_frame, **kwargs)
+    result = {name: int(value) for name, value in zip(COUNTS, counts.sum(axis=0))}
+    result.update({name: float(value) for name, value in metrics(counts.sum(axis=0)).items()})
+    result["frames"] = len(counts)
+    return result
+
+
+def score_many(masks, sequence, first_frame, max_workers=None, **kwargs):
+    # Scores several mask sets, e.g. the MaskStores of run_sweep keyed by config, on a thread pool
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {key: pool.submit(score, value, sequence, first_frame, **kwargs) for key, value in masks.items()}
+        return {key: future.result() for key, future in futures.items()}
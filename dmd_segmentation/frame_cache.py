@@ -0,0 +1,107 @@
+import json
+import numpy as np
+
+from os import makedirs, remove, replace, scandir, stat
+from os.path import abspath, basename, dirname, exists, getsize, isdir, join
+from uuid import uuid4
+
+
+def source_fingerprint(path):
+    # Number, total size and latest modification of the source files, a folder's own mtime misses files
+    # that are overwritten in place
+    stats = [entry.stat() for entry in scandir(path) if entry.is_file()] if isdir(path) else [stat(path)]
+    return [len(stats), sum(s.st_size for s in stats), max((s.st_mtime_ns for s in stats), default=0)]
+
+
+class FrameCache:
+    def __init__(self, filename):
+        # filename + ".json" names the data file it describes, so metadata and frames are always replaced together
+        self.filename = filename
+        with open(filename + ".json") as f:
+            self.meta = json.load(f)
+        self.resolution = tuple(self.meta["resolution"])
+        self.fps = self.meta["fps"]
+        self.start_frame = self.meta["start_frame"]
+        data = join(dirname(filename), self.meta["data"])
+        if getsize(data) != np.prod(self.meta["shape"]) * np.dtype(self.meta["dtype"]).itemsize:
+            raise ValueError(f"frame cache {data} does not match its metadata")
+        self.frames = np.memmap(data, dtype=self.meta["dtype"], mode="r", shape=tuple(self.meta["shape"]))
+
+    @classmethod
+    def build(cls, source, path, filename, start_frame=0, **kwargs):
+        # Decode and normalize once, then write raw frames and metadata next to each other
+        if dirname(filename):
+            makedirs(dirname(filename), exist_ok=True)
+        # every build writes a data file of its own, which only becomes visible through the metadata
+        data = f"{filename}.{uuid4().hex[:12]}"
+        # taken before decoding, so that changes during the build lead to a rebuild next time
+        fingerprint = source_fingerprint(path)
+        count, dtype, n = 0, np.float64, 0
+        with open(data, "wb") as f:
+            for frame in source.stream(path, start_frame=start_frame, **kwargs):
+                dtype, n = frame.dtype, frame.shape[0]
+                f.write(frame.tobytes())
+                count += 1
+        meta = {
+            "source": abspath(path),
+            "fingerprint": fingerprint,
+            "data": basename(data),
+            "start_frame": start_frame,
+            "resolution": list(source.resolution),
+            "fps": getattr(source, "fps", None),
+            "dtype": np.dtype(dtype).str,
+            "shape": [count, n],
+        }
+        previous = None
+        if exists(filename + ".json"):
+            try:
+                with open(filename + ".json") as f:
+                    previous = json.load(f).get("data")
+            except (OSError, ValueError):
+                pass
+        with open(data + ".json", "w") as f:
+            json.dump(meta, f)
+        # a single atomic replace publishes metadata and data together, concurrent readers see either cache
+        replace(data + ".json", filename + ".json")
+        # readers that already mapped the previous data keep it until they are done
+        for stale in (previous and join(dirname(filename), previous), filename):
+            if stale and stale != data and exists(stale):
+                remove(stale)
+        return cls(filename)
+
+    def matches(self, path, start_frame=0, dtype=None):
+        return (
+            self.meta["source"] == abspath(path)
+            and self.meta.get("fingerprint") == source_fingerprint(path)
+            and self.start_frame <= start_frame
+            and (dtype is None or np.dtype(self.meta["dtype"]) == np.dtype(dtype))
+        )
+
+    def stream(self, start_frame=None):
+        # Rows of the memory map, yielded without copying
+        offset = 0 if start_frame is None else start_frame - self.start_frame
+        return iter(self.frames[offset:])
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def __len__(self):
+        return self.frames.shape[0]
+
+
+def cached_stream(source, path, start_frame, cache, **kwargs):
+    frame_cache = None
+    if exists(cache + ".json"):
+        try:
+            frame_cache = FrameCache(cache)
+        except (OSError, ValueError, KeyError):
+            # caches of an older layout, or data removed by a concurrent rebuild, are rebuilt
+            frame_cache = None
+        if frame_cache is not None and not frame_cache.matches(path, start_frame, kwargs.get("dtype")):
+            frame_cache = None
+    if frame_cache is None:
+        frame_cache = FrameCache.build(source, path, cache, start_frame=start_frame, **kwargs)
+    source.resolution = frame_cache.resolution
+    if frame_cache.fps is not None:
+        source.fps = frame_cache.fps
+    return frame_cache.stream(start_frame)
@@ -0,0 +1,56 @@
+import numpy as np
+
+from .profiling import profiled
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+from threading import Event, Thread
+
+
+_DONE = object()
+
+
+@profiled("normalize")
+def normalize_frame(frame, dtype=np.float64):
+    f = np.array(frame.ravel(), dtype=dtype)
+    return f / np.linalg.norm(f)
+
+
+def prefetch(items, func, num_workers=4, queue_size=16):
+    # Applies func to items on a thread pool while the consumer works on earlier results
+    # At most queue_size results are in flight, and they are yielded in the order of items
+    pool = ThreadPoolExecutor(max_workers=num_workers)
+    pending = Queue(maxsize=queue_size)
+    stop = Event()
+    errors = []
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                pending.put(entry, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def feed():
+        try:
+            for item in items:
+                if not put(pool.submit(func, item)):
+                    return
+        except Exception as e:
+            errors.append(e)
+        put(_DONE)
+
+    feeder = Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        while True:
+            future = pending.get()
+            if future is _DONE:
+                break
+            yield future.result()
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
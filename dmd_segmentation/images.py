@@ -1,18 +1,40 @@
 import numpy as np
 
+from .frame_cache import cached_stream
+from .frames import normalize_frame, prefetch
+from .profiling import profiled
+from itertools import islice
 from os import listdir
 from os.path import isfile, join
-from PIL import Image as pim
 
 
 class Image:
     def __init__(self):
         self.resolution = (None, None)
 
-    def get_images(self, foldername):
+    def _files(self, foldername):
         files = sorted([ f for f in listdir(foldername) if isfile(join(foldername, f)) ])
         for file in files:
-            im = pim.open(join(foldername, file)).convert('L')
-            if self.resolution[0] is None:
-                self.resolution = (im.size[1], im.size[0])
-            yield np.asarray(im)
+            yield join(foldername, file)
+
+    @profiled("decode")
+    def _load(self, filename):
+        from PIL import Image as pim
+        im = pim.open(filename).convert('L')
+        if self.resolution[0] is None:
+            self.resolution = (im.size[1], im.size[0])
+        return np.asarray(im)
+
+    def num_frames(self, foldername, start_frame=0):
+        return max(sum(1 for _ in self._files(foldername)) - start_frame, 0)
+
+    def get_images(self, foldername):
+        for filename in self._files(foldername):
+            yield self._load(filename)
+
+    def stream(self, foldername, start_frame=0, num_workers=4, queue_size=16, cache=None, dtype=np.float64):
+        # Normalized, flattened frames decoded ahead of time on a thread pool
+        if cache is not None:
+            return cached_stream(self, foldername, start_frame, cache, num_workers=num_workers, queue_size=queue_size, dtype=dtype)
+        files = islice(self._files(foldername), start_frame, None)
+        return prefetch(files, lambda filename: normalize_frame(self._load(filename), dtype), num_workers, queue_size)
@@ -0,0 +1,76 @@
+import numpy as np
+
+from scipy.linalg import qr, svd
+
+
+class IncrementalSVD:
+    def __init__(self, max_rank=None, resync_every=50, oversampling=5):
+        # a few directions beyond max_rank are tracked to limit the error introduced by truncating every update
+        self.max_rank = max_rank
+        self.oversampling = oversampling
+        self.resync_every = resync_every
+        self.U = None
+        self.S = None
+        self.V = None
+        self._steps = 0
+
+    @property
+    def stale(self):
+        return self.U is None or (self.resync_every is not None and self._steps >= self.resync_every)
+
+    def invalidate(self):
+        self.U = None
+
+    def reset(self, Rx):
+        # Exact truncated SVD, used initially and to bound the drift of the updates
+        _U, _S, _Vh = svd(Rx, full_matrices=False, lapack_driver="gesvd")
+        self._set(_U, _S, _Vh.conj().T)
+        self._steps = 0
+
+    def _set(self, U, S, V):
+        if self.max_rank is not None:
+            rank = self.max_rank + self.oversampling
+            U = U[:, :rank]
+            S = S[:rank]
+            V = V[:, :rank]
+        self.U, self.S, self.V = U, S, V
+
+    def project(self, Rx):
+        # Rayleigh-Ritz: SVD of Rx restricted to the tracked left singular subspace, truncated to max_rank
+        _Ub, _S, _Vh = svd(self.U.conj().T @ Rx, full_matrices=False, lapack_driver="gesvd")
+        self.U, self.S, self.V = self.U @ _Ub, _S, _Vh.conj().T
+        rank = _S.shape[0] if self.max_rank is None else self.max_rank
+        return self.U[:, :rank], self.S[:rank], self.V[:, :rank]
+
+    def _refactor(self, U, C, V):
+        # Rediagonalize U @ C @ V^H for U, V with full column rank but not necessarily orthonormal
+        Qu, Ru = qr(U, mode="economic")
+        Qv, Rv = qr(V, mode="economic")
+        Us, Ss, Vsh = svd(Ru @ C @ Rv.conj().T, full_matrices=False, lapack_driver="gesvd")
+        self._set(Qu @ Us, Ss, Qv @ Vsh.conj().T)
+
+    def append(self, c):
+        # Rx gains the column c and one zero row at the bottom
+        if self.stale:
+            return
+        r = self.S.shape[0]
+        U = np.zeros((c.shape[0], r + 1), dtype=np.result_type(self.U, c))
+        U[:-1, :r] = self.U
+        U[:, r] = c
+        V = np.zeros((self.V.shape[0] + 1, r + 1), dtype=self.V.dtype)
+        V[:-1, :r] = self.V
+        V[-1, r] = 1.
+        C = np.diag(np.append(self.S, 1.))
+        self._refactor(U, C, V)
+        # one append per StreamingDMD update, a delete of the same update does not count again
+        self._steps += 1
+
+    def delete(self, rotations):
+        # The Givens rotations of the QR column deletion act on the rows of U,
+        # afterwards the leading column of Rx and the last (now zero) row are dropped
+        if self.stale:
+            return
+        U = self.U.copy()
+        for i, c, s in rotations:
+            U[i - 1], U[i] = c * U[i - 1] + s * U[i], c * U[i] - np.conj(s) * U[i - 1]
+        self._refactor(U[:-1], np.diag(self.S), self.V[1:])
@@ -0,0 +1,30 @@
+import numpy as np
+
+
+def as_precision(a, dtype):
+    # a in the floating point precision of dtype, complex values stay complex
+    if np.iscomplexobj(a):
+        dtype = np.result_type(dtype, np.complex64)
+    return np.asarray(a, dtype=dtype)
+
+
+class LowRankOperator:
+    def __init__(self, left, core, right):
+        # Represents left @ core @ right^H, applied right to left
+        assert left.shape[1] == core.shape[0] and core.shape[1] == right.shape[1]
+        self.left = left
+        self.core = core
+        self.right = right
+        self._right_h = right.conj().T
+
+    def __call__(self, x):
+        # the small factors are brought to the precision of left before the tall product
+        return self.left @ as_precision(self.core @ (self._right_h @ x), self.left.dtype)
+
+    @property
+    def shape(self):
+        return (self.left.shape[0], self.right.shape[0])
+
+    @property
+    def rank(self):
+        return min(self.core.shape)
@@ -0,0 +1,144 @@
+import json
+import numpy as np
+
+from os import makedirs, replace
+from os.path import dirname, join
+
+
+class MaskStore:
+    def __init__(self, resolution, threshold=1e-3, filename=None, chunk_size=256):
+        # Binary foreground masks, thresholded on arrival and bit packed (one bit per pixel).
+        # Full chunks of chunk_size masks are appended to filename if given, which is memory mapped for reading,
+        # otherwise they stay in memory. Metadata is kept next to the data in filename + ".json".
+        self.resolution = tuple(resolution)
+        self.threshold = threshold
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.row_bytes = (int(np.prod(self.resolution)) + 7) // 8
+        self._rows = np.empty((0, self.row_bytes), dtype=np.uint8) # flushed rows of an in memory store
+        self._chunk = np.empty((chunk_size, self.row_bytes), dtype=np.uint8)
+        self._fill = 0
+        self._stored = 0
+        self._map = None
+        self.indices = [] # frame index of every mask
+        if filename is not None:
+            if dirname(filename):
+                makedirs(dirname(filename), exist_ok=True)
+            open(filename, "wb").close()
+
+    @classmethod
+    def open(cls, filename):
+        # Read only access to a store written before
+        with open(filename + ".json") as f:
+            meta = json.load(f)
+        store = cls.__new__(cls)
+        store.resolution = tuple(meta["resolution"])
+        store.threshold = meta["threshold"]
+        store.filename = filename
+        store.chunk_size = 0
+        store.row_bytes = meta["row_bytes"]
+        store._rows = None
+        store._chunk = np.empty((0, store.row_bytes), dtype=np.uint8)
+        store._fill = 0
+        store._stored = meta["count"]
+        store._map = None
+        store.indices = meta.get("indices", list(range(store._stored)))
+        return store
+
+    def append(self, fg, index=None):
+        self.append_mask(np.asarray(fg) > self.threshold, index)
+
+    def append_mask(self, mask, index=None):
+        self.indices.append(len(self) if index is None else index)
+        self._chunk[self._fill] = np.packbits(np.ravel(mask))
+        self._fill += 1
+        if self._fill == self.chunk_size:
+            self._flush_chunk()
+
+    def _flush_chunk(self):
+        if self._fill == 0:
+            return
+        if self.filename is None:
+            if self._stored + self._fill > self._rows.shape[0]:
+                rows = np.empty((max(2 * self._rows.shape[0], self._stored + self._fill), self.row_bytes), dtype=np.uint8)
+                rows[:self._stored] = self._rows[:self._stored]
+                self._rows = rows
+            self._rows[self._stored:self._stored + self._fill] = self._chunk[:self._fill]
+        else:
+            with open(self.filename, "ab") as f:
+                f.write(self._chunk[:self._fill].tobytes())
+            self._map = None
+        self._stored += self._fill
+        self._fill = 0
+
+    def flush(self):
+        self._flush_chunk()
+        if self.filename is not None:
+            meta = {
+                "resolution": list(self.resolution),
+                "threshold": self.threshold,
+                "row_bytes": self.row_bytes,
+                "count": self._stored,
+                "indices": self.indices[:self._stored],
+            }
+            with open(self.filename + ".json.tmp", "w") as f:
+                json.dump(meta, f)
+            replace(self.filename + ".json.tmp", self.filename + ".json")
+
+    def close(self):
+        self.flush()
+
+    def __call__(self, index, res, fg):
+        # sink interface of run_pipeline
+        if fg is not None:
+            self.append(fg, index)
+
+    def _stored_rows(self):
+        if self.filename is None:
+            return self._rows
+        if self._map is None and self._stored > 0:
+            self._map = np.memmap(self.filename, dtype=np.uint8, mode="r", shape=(self._stored, self.row_bytes))
+        return self._map
+
+    def packed(self, index):
+        # Packed rows of the masks selected by index (an int, a slice or an array of ints)
+        indices = np.arange(len(self))[index]
+        rows = np.empty((np.size(indices), self.row_bytes), dtype=np.uint8)
+        flat = np.atleast_1d(indices)
+        stored = flat < self._stored
+        if stored.any():
+            rows[stored] = self._stored_rows()[flat[stored]]
+        rows[~stored] = self._chunk[flat[~stored] - self._stored]
+        return rows[0] if np.ndim(indices) == 0 else rows
+
+    def __getitem__(self, index):
+        rows = self.packed(index)
+        count = int(np.prod(self.resolution))
+        masks = np.unpackbits(rows, axis=-1, count=count).astype(bool)
+        return masks.reshape(rows.shape[:-1] + self.resolution)
+
+    def __iter__(self):
+        block = self.chunk_size or 256
+        for start in range(0, len(self), block):
+            yield from self[start:start + block]
+
+    def __len__(self):
+        return self._stored + self._fill
+
+    def __getstate__(self):
+        # in memory stores travel between processes as their packed rows
+        assert self.filename is None, "only in memory stores can be pickled"
+        self._flush_chunk()
+        state = self.__dict__.copy()
+        state["_chunk"] = np.empty((self.chunk_size, self.row_bytes), dtype=np.uint8)
+        return state
+
+    def export(self, directory, resolution=None, first_index=1, pattern="bin{:06d}.png"):
+        # CDnet style results: one PNG per frame, 255 marks foreground, numbered first_index + frame index
+        from PIL import Image
+        makedirs(directory, exist_ok=True)
+        resolution = self.resolution if resolution is None else tuple(resolution)
+        for index, mask in zip(self.indices, self):
+            image = np.where(mask.reshape(resolution), np.uint8(255), np.uint8(0))
+            Image.fromarray(image).save(join(directory, pattern.format(first_index + index)), compress_level=1)
+        return len(self)
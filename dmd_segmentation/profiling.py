@@ -0,0 +1,193 @@
+import csv
+import json
+import tracemalloc
+
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from threading import Lock, local
+from time import perf_counter
+
+
+_profiler = None
+_disabled = nullcontext()
+
+
+class Profiler:
+    def __init__(self, track_memory=False, sink=None):
+        # Running per stage aggregates (calls, total and max seconds, net traced allocations with track_memory)
+        # plus named counters. Per call records are only kept if a sink is given: a file name (CSV for .csv,
+        # JSON lines otherwise) they are streamed to, or a list they are appended to.
+        self.track_memory = track_memory
+        self.stages = {}
+        self.counters = defaultdict(int)
+        self._lock = Lock()
+        self._active = local()
+        self._owns_tracing = False
+        self._file = None
+        self._sink = sink
+        if isinstance(sink, str):
+            self._file = open(sink, "w", newline="")
+            if sink.endswith(".csv"):
+                writer = csv.DictWriter(self._file, fieldnames=self._fields())
+                writer.writeheader()
+                self._sink = writer.writerow
+            else:
+                self._sink = lambda record: self._file.write(json.dumps(record) + "\n")
+        elif sink is not None:
+            self._sink = sink.append
+
+    @property
+    def keeps_records(self):
+        return self._sink is not None
+
+    def _fields(self):
+        return ["stage", "start", "seconds"] + (["bytes"] if self.track_memory else [])
+
+    @contextmanager
+    def stage(self, name):
+        active = getattr(self._active, "names", None)
+        if active is None:
+            active = self._active.names = set()
+        if name in active:
+            # nested calls of the same stage, e.g. through super(), are only recorded once
+            yield
+            return
+        active.add(name)
+        memory = tracemalloc.get_traced_memory()[0] if self.track_memory else 0
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            record = {"stage": name, "start": start, "seconds": seconds}
+            if self.track_memory:
+                record["bytes"] = tracemalloc.get_traced_memory()[0] - memory
+            active.discard(name)
+            self._add(record)
+
+    def _add(self, record):
+        with self._lock:
+            stats = self.stages.get(record["stage"])
+            if stats is None:
+                stats = self.stages[record["stage"]] = {"calls": 0, "total": 0., "max": 0., "bytes": 0}
+            stats["calls"] += 1
+            stats["total"] += record["seconds"]
+            stats["max"] = max(stats["max"], record["seconds"])
+            stats["bytes"] += record.get("bytes", 0)
+            if self._sink is not None:
+                self._sink(record)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def merge(self, stages, counters, records=()):
+        # Adds the aggregates, counters and per call records of another profiler, e.g. one of a worker process
+        with self._lock:
+            for name, other in stages.items():
+                stats = self.stages.setdefault(name, {"calls": 0, "total": 0., "max": 0., "bytes": 0})
+                stats["calls"] += other["calls"]
+                stats["total"] += other["total"]
+                stats["max"] = max(stats["max"], other["max"])
+                stats["bytes"] += other["bytes"]
+            for name, value in counters.items():
+                self.counters[name] += value
+            if self._sink is not None:
+                for record in records:
+                    self._sink(record)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def summary(self):
+        # One row per stage: calls, total, mean and max seconds, share of the total time
+        # (stages nested in other stages, e.g. eig inside an adaptive update, count towards both)
+        total = sum(stats["total"] for stats in self.stages.values()) or 1.
+        rows = []
+        for name, stats in sorted(self.stages.items(), key=lambda item: -item[1]["total"]):
+            row = {
+                "stage": name,
+                "calls": stats["calls"],
+                "total": stats["total"],
+                "mean": stats["total"] / stats["calls"],
+                "max": stats["max"],
+                "share": stats["total"] / total,
+            }
+            if self.track_memory:
+                row["bytes"] = stats["bytes"]
+            rows.append(row)
+        return rows
+
+    def format_summary(self):
+        lines = [f"{'stage':>14} {'calls':>7} {'total s':>10} {'mean ms':>10} {'max ms':>10} {'share':>7}"]
+        for row in self.summary():
+            lines.append(f"{row['stage']:>14} {row['calls']:>7} {row['total']:>10.3f} {1e3 * row['mean']:>10.3f} {1e3 * row['max']:>10.3f} {100 * row['share']:>6.1f}%")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:>14} {value:>7}")
+        return "\n".join(lines)
+
+    def to_jsonl(self, filename):
+        # The summary rows followed by the counters, per call records go to the sink
+        with open(filename, "w") as f:
+            for row in self.summary():
+                f.write(json.dumps(row) + "\n")
+            for name, value in sorted(self.counters.items()):
+                f.write(json.dumps({"counter": name, "value": value}) + "\n")
+
+    def to_csv(self, filename):
+        fields = ["stage", "calls", "total", "mean", "max", "share"] + (["bytes"] if self.track_memory else [])
+        with open(filename, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.summary())
+
+
+def enable(track_memory=False, sink=None):
+    global _profiler
+    _profiler = Profiler(track_memory=track_memory, sink=sink)
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _profiler._owns_tracing = True
+    return _profiler
+
+
+def disable():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.close()
+        if profiler._owns_tracing:
+            tracemalloc.stop()
+    return profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+def stage(name):
+    # Times the enclosed block if profiling is enabled, otherwise a shared no-op context
+    if _profiler is None:
+        return _disabled
+    return _profiler.stage(name)
+
+
+def count(name, n=1):
+    if _profiler is not None:
+        _profiler.count(name, n)
+
+
+def profiled(name):
+    # Decorator version of stage, the disabled path costs one global lookup per call
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _profiler.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
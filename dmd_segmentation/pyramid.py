@@ -0,0 +1,85 @@
+import numpy as np
+
+from .snapshots import SnapshotBuffer
+from .streaming_dmd import StreamingDMD
+from scipy.linalg import lstsq
+
+
+class PyramidStreamingDMD:
+    def __init__(self, resolution, factor=4, max_hist=None, max_rank=None, flag_tol=0.1, dilate=1, **kwargs):
+        # The StreamingDMD runs on frames mean pooled by factor x factor blocks. The coarse background is a
+        # combination of the coarse snapshots, the same combination of the full resolution snapshots is only
+        # evaluated on the blocks whose coarse foreground exceeds flag_tol (relative to the mean pixel of a
+        # normalized coarse frame), grown by dilate blocks. Elsewhere the coarse background is upsampled.
+        assert max_hist is not None
+        self.resolution = tuple(resolution)
+        self.factor = factor
+        self.flag_tol = flag_tol
+        self.dilate = dilate
+        self.model = StreamingDMD(max_hist=max_hist, max_rank=max_rank, **kwargs)
+
+        self._starts = [np.arange(0, size, factor) for size in self.resolution]
+        self._counts = np.outer(*[np.diff(np.append(s, size)) for s, size in zip(self._starts, self.resolution)])
+        self.coarse_resolution = self._counts.shape
+        # coarse pixel of every full resolution pixel
+        rows, cols = [np.arange(size) // factor for size in self.resolution]
+        self._blocks = (rows[:, np.newaxis] * self.coarse_resolution[1] + cols[np.newaxis, :]).ravel()
+        # full resolution snapshots scaled like their normalized coarse counterparts
+        self._snapshots = SnapshotBuffer(capacity=max_hist + 1)
+        self._scale = 1.
+        self.flags = np.zeros(self.coarse_resolution, dtype=bool)
+
+    def pool(self, x):
+        frame = np.reshape(x, self.resolution)
+        sums = np.add.reduceat(np.add.reduceat(frame, self._starts[0], axis=0), self._starts[1], axis=1)
+        return (sums / self._counts).ravel()
+
+    def _push(self, x):
+        xc = self.pool(x)
+        self._scale = np.linalg.norm(xc)
+        self._snapshots.append(x / self._scale)
+        return xc / self._scale
+
+    def update(self, x, y):
+        if len(self._snapshots) == 0:
+            self._x = self._push(x)
+        y = self._push(y)
+        self.model.update(self._x, y)
+        self._x = y
+
+    @property
+    def residuals(self):
+        return self.model.residuals
+
+    def _flag(self, fg):
+        flags = fg.reshape(self.coarse_resolution) > self.flag_tol / np.sqrt(fg.shape[0])
+        for _ in range(self.dilate):
+            grown = flags.copy()
+            grown[1:] |= flags[:-1]
+            grown[:-1] |= flags[1:]
+            grown[:, 1:] |= flags[:, :-1]
+            grown[:, :-1] |= flags[:, 1:]
+            flags = grown
+        return flags
+
+    def background(self, x_index=None, eig_threshold=5e-3):
+        # The full resolution background, exact up to the SVD truncation on the flagged blocks
+        m = self.model
+        bg = m.background(x_index, eig_threshold)
+        self.flags = self._flag(np.abs(self._x - bg))
+
+        # the coarse background in terms of the snapshots of the QR factors
+        R = m._R
+        w = lstsq(R, m._background_coords(len(m) if x_index is None else x_index, eig_threshold))[0]
+        full = bg[self._blocks]
+        flagged = np.flatnonzero(self.flags.ravel()[self._blocks])
+        if flagged.size:
+            full[flagged] = self._snapshots.view[flagged, -R.shape[1]:] @ w
+        # back to the scale of the normalized full resolution frames
+        return self._scale * full
+
+    def foreground(self, x, x_index=None, eig_threshold=5e-3):
+        return np.abs(x - self.background(x_index, eig_threshold))
+
+    def __len__(self):
+        return len(self.model)
@@ -0,0 +1,111 @@
+import numpy as np
+
+from scipy.linalg import get_blas_funcs, get_lapack_funcs
+
+
+class StreamingQR:
+    def __init__(self, capacity=None, num_reorth=3, initial_capacity=16):
+        assert capacity is None or capacity > 0
+        self.capacity = capacity
+        self.initial_capacity = initial_capacity
+        self.num_reorth = num_reorth
+        self._Q = None
+        self._R = None
+        self._k = 0
+        self.rotations = []
+        # coordinates of the columns dropped by the last delete in the new basis, until the next append
+        self.dropped = None
+
+    def _allocate(self, rows, dtype):
+        if not np.issubdtype(dtype, np.inexact):
+            dtype = np.float64
+        cols = self.capacity if self.capacity is not None else self.initial_capacity
+        self._Q = np.zeros((rows, cols), dtype=dtype, order="F")
+        self._R = np.zeros((cols, cols), dtype=dtype, order="F")
+        self._gemv, self._nrm2 = get_blas_funcs(("gemv", "nrm2"), (self._Q,))
+        if np.iscomplexobj(self._Q):
+            self._lartg, self._rot = get_lapack_funcs(("lartg", "rot"), (self._Q,))
+        else:
+            self._lartg = get_lapack_funcs("lartg", (self._Q,))
+            self._rot = get_blas_funcs("rot", (self._Q,))
+
+    def _grow(self):
+        cols = 2 * self._Q.shape[1]
+        if self.capacity is not None:
+            cols = min(cols, self.capacity)
+        assert cols > self._k, "StreamingQR capacity exceeded"
+        Q = np.zeros((self._Q.shape[0], cols), dtype=self._Q.dtype, order="F")
+        R = np.zeros((cols, cols), dtype=self._R.dtype, order="F")
+        Q[:, :self._k] = self.Q
+        R[:self._k, :self._k] = self.R
+        self._Q, self._R = Q, R
+
+    def append(self, y):
+        if self._Q is None:
+            self._allocate(y.shape[0], y.dtype)
+        if self._k == self._Q.shape[1]:
+            self._grow()
+
+        k = self._k
+        Q = self._Q[:, :k]
+        y_diff = self._Q[:, k]
+        y_diff[:] = y
+        y_o = self._R[:k, k]
+        y_o[:] = 0.
+        # Reorthonormalize against the current basis, working directly in the new column of Q
+        if k > 0:
+            for _ in range(self.num_reorth):
+                py = self._gemv(1., Q, y_diff, trans=2)
+                y_o += py
+                self._gemv(-1., Q, py, beta=1., y=y_diff, overwrite_y=True)
+        nqy = self._nrm2(y_diff)
+        y_diff /= nqy
+        self._R[k, k] = nqy
+        self._k += 1
+        self.dropped = None
+
+    def delete(self, p=1):
+        # Drop the leading p columns and restore triangularity of R with Givens rotations
+        assert 0 <= p <= self._k
+        self.rotations = []
+        self.dropped = None
+        if p == 0:
+            return
+        k = self._k
+        m = k - p
+        R = self._R[:k, :k]
+        for j in range(m):
+            for i in range(j + p, j, -1):
+                c, s, r = self._lartg(R[i - 1, j + p], R[i, j + p])
+                R[i - 1, j + p] = r
+                R[i, j + p] = 0.
+                if j + p + 1 < k:
+                    R[i - 1, j + p + 1:], R[i, j + p + 1:] = self._rot(R[i - 1, j + p + 1:].copy(), R[i, j + p + 1:].copy(), c, s)
+                # the dropped columns are rotated along, which keeps their coordinates in the new basis
+                R[i - 1, :p], R[i, :p] = self._rot(R[i - 1, :p].copy(), R[i, :p].copy(), c, s)
+                self._rot(self._Q[:, i - 1], self._Q[:, i], c, np.conj(s), overwrite_x=True, overwrite_y=True)
+                self.rotations.append((i, c, s))
+        self.dropped = R[:m, :p].copy()
+        R[:m, :m] = R[:m, p:]
+        R[:, m:] = 0.
+        R[m:, :] = 0.
+        self._k = m
+
+    @property
+    def Q(self):
+        if self._Q is None:
+            return None
+        return self._Q[:, :self._k]
+
+    @property
+    def R(self):
+        if self._R is None:
+            return None
+        return self._R[:self._k, :self._k]
+
+    @property
+    def shape(self):
+        return (None if self._Q is None else self._Q.shape[0], self._k)
+
+    def __len__(self):
+        return self._k
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class SnapshotBuffer:
+    def __init__(self, capacity=None, initial_capacity=16):
+        assert capacity is None or capacity > 0
+        self.capacity = capacity
+        self.initial_capacity = initial_capacity
+        self._data = None
+        self._start = 0
+        self._len = 0
+
+    @classmethod
+    def from_array(cls, block, capacity=None):
+        buf = cls(capacity=capacity)
+        if capacity is not None:
+            block = block[:, -capacity:]
+        buf._allocate(block.shape[0], block.shape[1], block.dtype)
+        buf._data[:, :block.shape[1]] = block
+        if capacity is not None:
+            # keep the mirrored half consistent with the primary half
+            buf._data[:, capacity:capacity + block.shape[1]] = block
+        buf._len = block.shape[1]
+        return buf
+
+    def _allocate(self, rows, cols, dtype):
+        if not np.issubdtype(dtype, np.inexact):
+            dtype = np.float64
+        if self.capacity is not None:
+            # each column is stored twice so that any window of at most
+            # `capacity` consecutive columns is a contiguous slice
+            cols = 2 * self.capacity
+        else:
+            cols = max(cols, self.initial_capacity)
+        self._data = np.empty((rows, cols), dtype=dtype, order="F")
+
+    def append(self, x):
+        if self._data is None:
+            self._allocate(x.shape[0], 1, x.dtype)
+
+        if self.capacity is None:
+            if self._len == self._data.shape[1]:
+                data = np.empty((self._data.shape[0], 2 * self._len), dtype=self._data.dtype, order="F")
+                data[:, :self._len] = self._data
+                self._data = data
+            self._data[:, self._len] = x
+            self._len += 1
+            return
+
+        if self._len == self.capacity:
+            self._start = (self._start + 1) % self.capacity
+            self._len -= 1
+        slot = (self._start + self._len) % self.capacity
+        self._data[:, slot] = x
+        self._data[:, slot + self.capacity] = x
+        self._len += 1
+
+    @property
+    def view(self):
+        if self._data is None:
+            return np.empty((0, 0))
+        return self._data[:, self._start:self._start + self._len]
+
+    def __getitem__(self, index):
+        return self.view[:, index]
+
+    def __len__(self):
+        return self._len
@@ -1,13 +1,19 @@
 import numpy as np
 
 from .dmd import DMD
+from .isvd import IncrementalSVD
+from .lowrank import LowRankOperator, as_precision
+from .profiling import count, profiled
+from .qr import StreamingQR
 from logging import getLogger, INFO
-from scipy.linalg import qr_delete, svd, solve
+from scipy.linalg import svd, solve
     
 
 class StreamingDMD(DMD): #MARK: Streaming
-    def __init__(self, max_hist=None, max_rank=None, adaptive=None, reset_ratio=None, reset_tol=None, num_reorth=3):
-        super().__init__(max_rank=max_rank)
+    def __init__(self, max_hist=None, max_rank=None, adaptive=None, reset_ratio=None, reset_tol=None, num_reorth=3, incremental_svd=False, resync_every=50, dtype=np.float64):
+        super().__init__(max_rank=max_rank, max_hist=max_hist, dtype=dtype)
+        # the y snapshots live in the QR factors, only x is kept for the amplitude fits
+        self._Y = None
         self.logger = getLogger("StreamingDMD")
         self.logger.setLevel(INFO)
 
@@ -19,75 +25,153 @@ class StreamingDMD(DMD): #MARK: Streaming
             self.reset_ratio = reset_ratio
             self.reset_tol = reset_tol
             self._last_prediction_error = np.inf
-        self.max_hist = max_hist
         self.num_reorth = num_reorth
-        self._Q = None
-        self._R = None
+        self._qr = StreamingQR(capacity=None if max_hist is None else max_hist + 1, num_reorth=num_reorth)
+        # Optionally track the truncated SVD of R[:, :-1] through the QR updates instead of recomputing it
+        self._isvd = IncrementalSVD(max_rank=max_rank, resync_every=resync_every) if incremental_svd else None
 
+    @profiled("update")
     def update(self, x, y):
-        super().update(x, y)
+        x = self._cast(x).reshape((-1, 1))
+        y = self._cast(y).reshape((-1, 1))
+        self._X.append(x[:, 0])
 
-        if self.max_hist is not None:
-            if self._len > self.max_hist:
-                self._len -= 1
-                self._X = self._X[1:]
-                self._Y = self._Y[1:]
+        if len(self._qr) == 0:
+            self._qr.append(x[:, 0])
+        elif self.adaptive:
+            # If history is adaptive truncate to given length
+            pred_error = self.prediction_error_many(x, y)[0]
 
-        x = x.reshape((-1, 1))
-        y = y.reshape((-1, 1))
+            if pred_error > self.reset_tol * self._last_prediction_error:
+                self.logger.info(f"RESET    |    Memory has {len(self._qr)} snapshots. Prediction error {pred_error:6.3e} is larger than {self.reset_tol * self._last_prediction_error:6.3e} ({self.reset_tol:6.3e} * {self._last_prediction_error:6.3e})!")
+                count("resets")
+                self._qr.delete(int(len(self._qr) / self.reset_ratio))
+                if self._isvd is not None:
+                    self._isvd.invalidate()
+                self._invalidate()
+                pred_error = self.prediction_error_many(x, y)[0]
 
-        if len(self) == 1:
-            self._Q, self._R = np.linalg.qr(np.hstack([self.X, y]))
-        else:
-            # If history is adaptive truncate to given length
-            if self.adaptive:
-                ny = np.linalg.norm(y)
-                pred_error = np.linalg.norm(y - self.__call__(x)) / ny
-
-                if pred_error > self.reset_tol * self._last_prediction_error:
-                    self.logger.info(f"RESET    |    Memory has {self._R.shape[1]} snapshots. Prediction error {pred_error:6.3e} is larger than {self.reset_tol * self._last_prediction_error:6.3e} ({self.reset_tol:6.3e} * {self._last_prediction_error:6.3e})!")
-                    self._Q, self._R = qr_delete(self._Q, self._R, 0, p=int(self._R.shape[1] / self.reset_ratio), which="col")
-
-                self._last_prediction_error = np.linalg.norm(y - self.__call__(x)) / ny
-
-            # Update QR decomposition by appending y
-            # Reorthonormalize
-            y_o = np.zeros((self._Q.shape[1], 1))
-            y_diff = y.copy()
-            for _ in range(self.num_reorth):
-                py = np.einsum("ji,jk->ik", self._Q.conj(), y_diff)
-                y_o += py
-                y_diff -= self._Q @ py
-            nqy = np.linalg.norm(y_diff)
-            qy = y_diff / nqy
-            self._Q = np.hstack([self._Q, qy])
-            self._R = np.hstack([
-                np.vstack([self._R, np.zeros((1, self._R.shape[1]))]),
-                np.vstack([y_o, nqy])
-            ])
+            self._last_prediction_error = pred_error
+
+        # Update QR decomposition by appending y
+        self._qr.append(y[:, 0])
+        if self._isvd is not None:
+            self._isvd.append(as_precision(self._R[:, -2], np.float64))
 
         # Truncate history to a fixed length
         if self.max_hist is not None:
-            if self._R.shape[1] > self.max_hist:
-                self._Q, self._R = qr_delete(self._Q, self._R, 0, which="col")
+            if len(self._qr) > self.max_hist:
+                self._qr.delete(1)
+                if self._isvd is not None:
+                    self._isvd.delete(self._qr.rotations)
+        self._invalidate()
+
+    @property
+    def _Q(self):
+        return self._qr.Q
+
+    @property
+    def Y(self):
+        # The y snapshots still held by the QR factors, lifted from R on demand
+        return self._lift(self._R[:, max(len(self._qr) - len(self), 0):])
+
+    @property
+    def _R(self):
+        return self._qr.R
+
+    @staticmethod
+    def _amplitudes(gram, G, vander):
+        # Least squares amplitudes for the modes with Gram matrix gram and projected snapshots G
+        return solve(
+            gram * (vander.conj() @ vander.T),
+            (vander.conj() * G) @ np.ones(G.shape[1]),
+            assume_a="pos"
+        )
 
+    @profiled("reconstruct")
     def reconstruct(self, modes, amps, times=[]):
         Qmodes, Rmodes = np.linalg.qr(modes)
         if not times:
             times = range(len(self))
-        G = Qmodes.conj().T @ self.X
-        vander = np.array([
-            np.power(amp, times) for amp in amps
-        ])
-        alpha = solve(
-            (Rmodes.conj().T @ Rmodes) * (vander.conj() @ vander.T),
-            (vander.conj() * (Rmodes.conj().T @ G)) @ np.ones(G.shape[1]),
-            assume_a="pos"
-        )
-        return modes @ np.diag(alpha) @ vander
+        vander = np.power.outer(amps, np.asarray(times))
+        alpha = self._amplitudes(Rmodes.conj().T @ Rmodes, Rmodes.conj().T @ (Qmodes.conj().T @ self.X), vander)
+        return (modes * alpha) @ vander
+
+    def _QhX(self):
+        # Coordinates of the x snapshots in the basis Q, all but the oldest ones are columns of R already
+        # and the snapshot dropped from a full window was carried through the Givens rotations of the delete.
+        # Only snapshots dropped by an adaptive reset are projected in pixel space, the appends after the
+        # reset have moved the basis.
+        def compute():
+            missing = len(self) - (len(self._qr) - 1)
+            dropped = self._qr.dropped
+            carried = 0 if dropped is None else min(dropped.shape[1], missing)
+            blocks = [dropped[:, dropped.shape[1] - carried:]] if carried else []
+            if missing > carried:
+                blocks.insert(0, self._Q.conj().T @ self.X[:, :missing - carried])
+            return as_precision(np.hstack(blocks + [self._R[:, :-1]]), np.float64)
+        return self._cached("QhX", compute)
+
+    @profiled("reconstruct")
+    def _reconstruct_coords(self, coords, amps, times, key=None):
+        vander = np.power.outer(amps, times)
+
+        def compute():
+            _Ch = coords.conj().T
+            return self._amplitudes(_Ch @ coords, _Ch @ self._QhX(), vander)
+
+        if key is None:
+            alpha = compute()
+        else:
+            alpha = self._cached(("amplitudes", key, tuple(times)), compute)
+        return coords @ (alpha.reshape((-1, 1)) * vander)
 
-    def _tsvd(self):
-        _Rx = self._R[:, :-1]
+    def reconstruct_reduced(self, coords, amps, times=[], key=None):
+        # Same as reconstruct(self._Q @ coords, amps, times), but the fit happens in Q coordinates
+        # and only the final result is lifted to pixel space. Amplitudes are cached until the next
+        # update under key, e.g. the indices of the selected modes.
+        if not times:
+            times = range(len(self))
+        return self._lift(self._reconstruct_coords(coords, amps, np.asarray(times), key))
+
+    def background_indices(self, eig_threshold=5e-3):
+        # Modes (in the order of residuals) whose eigenvalues are close to one
+        _, _, amps = self.residuals
+        logamps = np.log(amps.astype(np.cdouble)) # this avoids nan problems
+        bg_indices = list(np.where(np.abs(logamps) < eig_threshold)[0])
+        if not bg_indices:
+            bg_indices = [0]
+        return bg_indices
+
+    def _background_coords(self, x_index, eig_threshold):
+        def compute():
+            _, modes, amps = self.residuals
+            bg_indices = self.background_indices(eig_threshold)
+            b = self._reconstruct_coords(modes[:, bg_indices], amps[bg_indices], np.array([x_index]), tuple(bg_indices))
+            b = b.real.reshape(-1)
+            # Q has orthonormal columns, so the background can be normalized before lifting it
+            return b / np.linalg.norm(b)
+        return self._cached(("background", x_index, eig_threshold), compute)
+
+    @profiled("background")
+    def background(self, x_index=None, eig_threshold=5e-3):
+        # Normalized background at time x_index (by default the frame following the stored snapshots)
+        if x_index is None:
+            x_index = len(self)
+        return self._lift(self._background_coords(x_index, eig_threshold))
+
+    def foreground(self, x, x_index=None, eig_threshold=5e-3):
+        return np.abs(x - self.background(x_index, eig_threshold))
+
+    @profiled("_tsvd")
+    def _compute_tsvd(self):
+        count("svd")
+        _Rx = as_precision(self._R[:, :-1], np.float64)
+        if self._isvd is not None:
+            if self._isvd.stale:
+                self._isvd.reset(_Rx)
+            _U, _S, _V = self._isvd.project(_Rx)
+            return _U, _V * (1. / _S)
 
         _U, _S, _Vh = svd(_Rx, full_matrices=False, lapack_driver="gesvd")
         if self.max_rank is not None:
@@ -96,34 +180,26 @@ class StreamingDMD(DMD): #MARK: Streaming
             _Vh = _Vh[:self.max_rank, :]
 
         return _U, (1. / _S) * _Vh.conj().T
-    
-    @property
-    def A(self):
-        _U, V_S_inv = self._tsvd()
-        return _U.conj().T @ (self._R[:, 1:] @ V_S_inv)
-    
+
     @property
-    def modes(self):
-        _U, V_S_inv = self._tsvd()
-        _A = (_U.conj().T @ self._R[:, 1:]) @ V_S_inv
-        evals, evecs = np.linalg.eig(_A)
-        return self._Q @ (_U @ evecs), evals
+    def _reduced_Y(self):
+        return as_precision(self._R[:, 1:], np.float64)
+
+    def _lift(self, coords):
+        return self._Q @ as_precision(coords, self._Q.dtype)
+
+    def _project(self, x):
+        return self._Q.conj().T @ self._cast(x)
     
     @property
     def residuals(self):
-        _U, V_S_inv = self._tsvd()
-        _Ry = self._R[:, 1:]
-        _A = (_U.conj().T @ _Ry) @ V_S_inv
-        evals, evecs = np.linalg.eig(_A)
-        residuals = np.linalg.norm(_Ry @ (V_S_inv @ evecs) - (_U @ evecs) * evals, axis=0)
-        P = np.argsort(residuals)
-        residuals = residuals[P]
-        evals = evals[P]
-        evecs = evecs[:, P]
-        return residuals, _U @ evecs, evals
-    
-    def __call__(self, x):
-        _U, V_S_inv = self._tsvd()
-        _A = self._R[:, 1:] @ V_S_inv @ _U.conj().T
+        return self._cached("residuals", self._compute_residuals)
 
-        return self._Q @ (_A @ (self._Q.conj().T @ x))
+    def _compute_residuals(self):
+        analysis = self.analyze()
+        P = np.argsort(analysis.residuals)
+        return analysis.residuals[P], analysis.U @ analysis.evecs[:, P], analysis.evals[P]
+    
+    def _compute_operator(self):
+        _U, _ = self._tsvd()
+        return LowRankOperator(self._Q, self._reduced_YV() @ _U.conj().T, self._Q)
@@ -0,0 +1,34 @@
+import numpy as np
+
+from .detection import stream_detect
+from .frames import normalize_frame
+from itertools import islice
+
+
+def normalize(frames, start_frame=0, dtype=np.float64):
+    for frame in islice(frames, start_frame, None):
+        yield normalize_frame(frame, dtype)
+
+
+def pairs(frames):
+    frames = iter(frames)
+    x = next(frames, None)
+    for y in frames:
+        yield x, y
+        x = y
+
+
+def pipeline(frames, max_hist, max_rank=5, tol=None, eig_threshold=5e-3, start_frame=0, dtype=np.float64):
+    # source -> normalize -> pair (x, y) -> StreamingDMD -> (residual, foreground)
+    # Only the current pair and the max_hist snapshots of the DMD are kept alive
+    return stream_detect(pairs(normalize(frames, start_frame, dtype)), max_hist, max_rank, tol, eig_threshold, dtype=dtype)
+
+
+def run_pipeline(frames, sinks, **kwargs):
+    # Pushes every (index, residual, foreground) of the pipeline into each sink as it is produced
+    count = 0
+    for index, (res, fg) in enumerate(pipeline(frames, **kwargs)):
+        for sink in sinks:
+            sink(index, res, fg)
+        count += 1
+    return count
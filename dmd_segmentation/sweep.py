@@ -0,0 +1,130 @@
+import numpy as np
+
+from . import profiling
+from .detection import detect_many
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from os import cpu_count
+
+
+SweepConfig = namedtuple("SweepConfig", ["max_hist", "max_rank", "tol", "eig_threshold", "mask_threshold"], defaults=[5, None, 5e-3, None])
+
+
+def _allocate(shape):
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(np.float64).itemsize)
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _share_frames(frames, num_frames=None):
+    # Frames are copied into shared memory one at a time as they arrive, so a stream of decoded frames
+    # is never held twice. num_frames sizes the segment for iterators, it is doubled if the stream is longer.
+    if num_frames is None:
+        num_frames = len(frames) if hasattr(frames, "__len__") else 16
+    shm, shared, count = None, None, 0
+    try:
+        for frame in frames:
+            if shared is None:
+                shm, shared = _allocate((max(num_frames, 1), len(frame)))
+            elif count == shared.shape[0]:
+                grown_shm, grown = _allocate((2 * count, shared.shape[1]))
+                grown[:count] = shared
+                del shared
+                shm.close()
+                shm.unlink()
+                shm, shared = grown_shm, grown
+            shared[count] = frame
+            count += 1
+        shape = (count, shared.shape[1])
+    except BaseException:
+        if shm is not None:
+            del shared
+            shm.close()
+            shm.unlink()
+        raise
+    del shared
+    return shm, shape
+
+
+def _groups(configs, mask_threshold=None):
+    # Configs with the same history length and rank share one StreamingDMD, they only differ in the post-processing
+    groups = {}
+    for index, config in enumerate(configs):
+        mode = (config.tol, config.eig_threshold, mask_threshold if config.mask_threshold is None else config.mask_threshold)
+        groups.setdefault((config.max_hist, config.max_rank), []).append((index, mode))
+    return groups
+
+
+def _detect_group(frames, key, group, resolution=None):
+    results = detect_many(frames, *key, [mode for _, mode in group], resolution)
+    return [(index, result) for (index, _), result in zip(group, results)]
+
+
+def _run_shared(name, shape, key, group, resolution=None, profile=None):
+    # With profile = (track_memory, keep_records) the group is profiled, the aggregates, counters and
+    # (if the parent keeps them) per call records are returned for the parent
+    shm = shared_memory.SharedMemory(name=name)
+    frames = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    # all groups share the segment, a worker must never modify the frames
+    frames.flags.writeable = False
+    records = []
+    if profile is not None:
+        track_memory, keep_records = profile
+        profiling.enable(track_memory, sink=records if keep_records else None)
+    try:
+        results = _detect_group(frames, key, group, resolution)
+    finally:
+        profiler = profiling.disable() if profile is not None else None
+        # the views have to be released before the segment can be closed
+        del frames
+        shm.close()
+    return results, None if profiler is None else (profiler.stages, dict(profiler.counters), records)
+
+
+def sweep(frames, configs, max_workers=None, mask_threshold=None, resolution=None, num_frames=None):
+    # Yields (index, (residuals, foregrounds)) for each config as soon as its group has finished
+    # With mask_threshold (or the mask_threshold of a config) bit packed masks are returned instead of foregrounds
+    # frames can be a stream of decoded frames, num_frames (an estimate is enough) avoids regrowing the shared memory
+    configs = [SweepConfig(*config) for config in configs]
+    groups = _groups(configs, mask_threshold)
+    if max_workers == 1:
+        with profiling.stage("load"):
+            frames = frames if hasattr(frames, "__getitem__") else list(frames)
+        for key, group in groups.items():
+            yield from _detect_group(frames, key, group, resolution)
+        return
+
+    with profiling.stage("load"):
+        shm, shape = _share_frames(frames, num_frames)
+    # the workers profile their groups if this process does
+    profiler = profiling.get_profiler()
+    profile = None if profiler is None else (profiler.track_memory, profiler.keeps_records)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers or min(len(groups), cpu_count())) as pool:
+            futures = [pool.submit(_run_shared, shm.name, shape, key, group, resolution, profile) for key, group in groups.items()]
+            for future in as_completed(futures):
+                results, profile = future.result()
+                if profile is not None:
+                    profiler.merge(*profile)
+                yield from results
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def run_sweep(frames, configs, max_workers=None, progress=False, **kwargs):
+    configs = [SweepConfig(*config) for config in configs]
+    results = {
+        "min_ress": None,
+        "fgs": {},
+    }
+    runs = sweep(frames, configs, max_workers=max_workers, **kwargs)
+    if progress:
+        from tqdm import tqdm
+        runs = tqdm(runs, total=len(configs), desc="Streaming QR sweep", ncols=90)
+    for index, (ress, fgs) in runs:
+        if results["min_ress"] is None:
+            results["min_ress"] = 1e-16 * np.ones((len(configs), len(ress)))
+        results["min_ress"][index, :] = ress
+        results["fgs"][configs[index]] = fgs
+    return results
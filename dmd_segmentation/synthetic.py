@@ -0,0 +1,34 @@
+import numpy as np
+
+
+def moving_blobs(resolution=(240, 320), num_frames=100, num_blobs=3, background="static", period=40, seed=0):
+    # Gaussian blobs bouncing over a smooth static or oscillating background, as 2D frames in [0, 255]
+    assert background in ("static", "oscillating")
+    rng = np.random.default_rng(seed)
+    height, width = resolution
+    rows, cols = np.meshgrid(np.arange(height), np.arange(width), indexing="ij")
+
+    bg = np.zeros(resolution)
+    for _ in range(4):
+        ky, kx = rng.uniform(0.5, 3., 2) * 2 * np.pi / np.array(resolution)
+        bg += np.cos(ky * rows + kx * cols + rng.uniform(0, 2 * np.pi))
+    bg = 100. + 20. * bg / 4.
+    ripple = np.sin(2 * np.pi * rows / max(height / 4, 1))
+
+    radius = max(min(resolution) / 12, 1.)
+    pos = rng.uniform([0, 0], [height, width], (num_blobs, 2))
+    vel = rng.uniform(-1, 1, (num_blobs, 2)) * radius / 4
+    for t in range(num_frames):
+        frame = bg.copy()
+        if background == "oscillating":
+            frame += 10. * np.sin(2 * np.pi * t / period) * ripple
+        for (py, px) in pos:
+            frame += 100. * np.exp(-((rows - py) ** 2 + (cols - px) ** 2) / (2 * radius ** 2))
+        yield np.clip(frame, 0., 255.)
+
+        pos += vel
+        # bounce off the borders
+        for axis, size in enumerate(resolution):
+            out = (pos[:, axis] < 0) | (pos[:, axis] > size - 1)
+            vel[out, axis] *= -1
+            pos[:, axis] = np.clip(pos[:, axis], 0, size - 1)
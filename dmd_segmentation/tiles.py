@@ -0,0 +1,87 @@
+import numpy as np
+
+from .streaming_dmd import StreamingDMD
+from concurrent.futures import ThreadPoolExecutor
+
+
+def tile_slices(resolution, tile_shape, overlap=0):
+    # Slices covering the frame with tiles of tile_shape that share overlap pixels with their neighbours,
+    # the last tile of every row and column is shifted back so that all tiles have the same shape
+    starts = []
+    for size, tile in zip(resolution, tile_shape):
+        tile = min(tile, size)
+        step = max(tile - overlap, 1)
+        axis = list(range(0, size - tile + 1, step))
+        if axis[-1] + tile < size:
+            axis.append(size - tile)
+        starts.append([slice(s, s + tile) for s in axis])
+    return [(rows, cols) for rows in starts[0] for cols in starts[1]]
+
+
+class TiledStreamingDMD:
+    def __init__(self, resolution, tile_shape=(64, 64), overlap=0, max_hist=None, max_rank=None, num_workers=4, skip_tol=None, **kwargs):
+        # One StreamingDMD per tile of the frame, the tiles are updated on a thread pool (numpy releases the GIL)
+        # and their backgrounds are stitched together, overlapping pixels are averaged.
+        # With skip_tol, tiles whose y differs from the last snapshot they stored by less than skip_tol (relative)
+        # keep their history and cached decompositions instead of being updated. A tile that resumes is updated
+        # with the pair (last stored snapshot, y), so its history stays consistent across the skipped frames.
+        self.resolution = tuple(resolution)
+        self.tiles = tile_slices(self.resolution, tile_shape, overlap)
+        self.max_hist = max_hist
+        self.skip_tol = skip_tol
+        self.models = [StreamingDMD(max_hist=max_hist, max_rank=max_rank, **kwargs) for _ in self.tiles]
+        self._scales = np.ones(len(self.tiles))
+        self._last = [None] * len(self.tiles) # last y snapshot of every tile, before normalization
+        self.updated = np.zeros(len(self.tiles), dtype=bool)
+        self._weights = np.zeros(self.resolution)
+        for rows, cols in self.tiles:
+            self._weights[rows, cols] += 1.
+        self._pool = ThreadPoolExecutor(max_workers=num_workers)
+
+    def _split(self, x):
+        frame = np.reshape(x, self.resolution)
+        return [frame[rows, cols].ravel() for rows, cols in self.tiles]
+
+    def _stitch(self, parts):
+        frame = np.zeros(self.resolution, dtype=np.result_type(*parts))
+        for (rows, cols), part in zip(self.tiles, parts):
+            frame[rows, cols] += part.reshape(frame[rows, cols].shape)
+        return (frame / self._weights).ravel()
+
+    def _map(self, func, *iterables):
+        return list(self._pool.map(func, *iterables))
+
+    def update(self, x, y):
+        def update_tile(m, last, x_t, y_t):
+            if last is not None:
+                # the skip test bounds the gap to the stored history, not just the change since the previous frame
+                x_t = last
+                if self.skip_tol is not None and np.linalg.norm(y_t - last) <= self.skip_tol * (np.linalg.norm(last) or 1.):
+                    return False
+            # the tiles are normalized like whole frames, their norms rescale the stitched background
+            m.update(x_t / (np.linalg.norm(x_t) or 1.), y_t / (np.linalg.norm(y_t) or 1.))
+            return True
+
+        xs, ys = self._split(x), self._split(y)
+        self.updated = np.array(self._map(update_tile, self.models, self._last, xs, ys))
+        for index in np.flatnonzero(self.updated):
+            self._last[index] = ys[index]
+        self._scales = np.where(self.updated, [np.linalg.norm(y_t) for y_t in ys], self._scales)
+
+    @property
+    def residuals(self):
+        # (minimal residual of every tile,)
+        return np.array(self._map(lambda m: np.min(m.residuals[0]), self.models)),
+
+    def background(self, x_index=None, eig_threshold=5e-3):
+        parts = self._map(lambda m: m.background(x_index, eig_threshold), self.models)
+        return self._stitch([scale * part for scale, part in zip(self._scales, parts)])
+
+    def foreground(self, x, x_index=None, eig_threshold=5e-3):
+        return np.abs(x - self.background(x_index, eig_threshold))
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __len__(self):
+        return len(self.models[0])
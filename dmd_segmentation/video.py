@@ -1,4 +1,8 @@
-import cv2 as cv
+import numpy as np
+
+from .frame_cache import cached_stream
+from .frames import normalize_frame, prefetch
+from .profiling import stage
 
 
 class Video:
@@ -6,14 +10,45 @@ class Video:
         self.resolution = (None, None)
         self.fps = None
 
-    def get_frames(self, filename):
+    def _raw_frames(self, filename, start_frame=0):
+        import cv2 as cv
         cap = cv.VideoCapture(filename)
         self.fps = cap.get(cv.CAP_PROP_FPS)
         self.resolution = (int(cap.get(cv.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv.CAP_PROP_FRAME_WIDTH)))
 
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if ret:
-                yield cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
-            else:
-                cap.release()
+        try:
+            # skipped frames are grabbed but never decoded
+            for _ in range(start_frame):
+                if not cap.grab():
+                    return
+            while cap.isOpened():
+                with stage("decode"):
+                    ret, frame = cap.read()
+                if ret:
+                    yield frame
+                else:
+                    cap.release()
+        finally:
+            cap.release()
+
+    def num_frames(self, filename, start_frame=0):
+        # Frame count of the container, an estimate for some codecs
+        import cv2 as cv
+        cap = cv.VideoCapture(filename)
+        try:
+            return max(int(cap.get(cv.CAP_PROP_FRAME_COUNT)) - start_frame, 0)
+        finally:
+            cap.release()
+
+    def get_frames(self, filename):
+        import cv2 as cv
+        for frame in self._raw_frames(filename):
+            yield cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+
+    def stream(self, filename, start_frame=0, num_workers=4, queue_size=16, cache=None, dtype=np.float64):
+        # Reading happens on a feeder thread, conversion and normalization on a thread pool
+        if cache is not None:
+            return cached_stream(self, filename, start_frame, cache, num_workers=num_workers, queue_size=queue_size, dtype=dtype)
+        import cv2 as cv
+        frames = self._raw_frames(filename, start_frame)
+        return prefetch(frames, lambda frame: normalize_frame(cv.cvtColor(frame, cv.COLOR_BGR2GRAY), dtype), num_workers, queue_size)
@@ -0,0 +1,133 @@
+import numpy as np
+
+from .profiling import stage
+from queue import Queue
+from threading import Thread
+
+
+_DONE = object()
+
+
+def threshold_masks(fgs, threshold=1e-3):
+    # Binary masks (0 or 255) of one or a stack of foregrounds
+    return np.where(np.asarray(fgs) > threshold, np.uint8(255), np.uint8(0))
+
+
+class _GifEncoder:
+    # Frames are appended to the file as they arrive, using the frame level helpers of Pillow's GIF plugin
+    def __init__(self, filename, fps):
+        self.file = open(filename, "wb")
+        self.duration = int(round(1000. / fps))
+        self.header = False
+
+    def _image(self, mask):
+        from PIL import Image
+        im = Image.fromarray((mask > 0).astype(np.uint8), mode="P")
+        im.putpalette([0, 0, 0, 255, 255, 255])
+        return im
+
+    def write(self, mask):
+        from PIL import GifImagePlugin
+        im = self._image(mask)
+        if not self.header:
+            chunks, _ = GifImagePlugin.getheader(im, None, {"loop": 0})
+            self.file.writelines(chunks)
+            self.header = True
+        self.file.writelines(GifImagePlugin.getdata(im, duration=self.duration))
+
+    def close(self):
+        self.file.write(b";")
+        self.file.close()
+
+
+class _VideoEncoder:
+    def __init__(self, filename, fps, resolution):
+        import cv2 as cv
+        fourcc = cv.VideoWriter_fourcc(*("mp4v" if filename.endswith(".mp4") else "MJPG"))
+        self.writer = cv.VideoWriter(filename, fourcc, fps, (resolution[1], resolution[0]), isColor=False)
+
+    def write(self, mask):
+        self.writer.write(mask)
+
+    def close(self):
+        self.writer.release()
+
+
+class _PngEncoder:
+    def __init__(self, pattern):
+        assert "{" in pattern, "PNG sequences need a pattern such as frame_{:05d}.png"
+        self.pattern = pattern
+        self.index = 0
+
+    def write(self, mask):
+        from PIL import Image
+        Image.fromarray(mask).save(self.pattern.format(self.index), compress_level=1)
+        self.index += 1
+
+    def close(self):
+        pass
+
+
+class MaskWriter:
+    def __init__(self, filename, resolution, fps=30, threshold=1e-3, queue_size=16):
+        # Thresholds foregrounds and encodes them on a background thread into a GIF, an MP4/AVI video
+        # or a PNG sequence (filename is a pattern like frame_{:05d}.png). At most queue_size frames are pending.
+        self.filename = filename
+        self.resolution = tuple(resolution)
+        self.threshold = threshold
+        if filename.endswith(".gif"):
+            self._encoder = _GifEncoder(filename, fps)
+        elif filename.endswith((".mp4", ".avi")):
+            self._encoder = _VideoEncoder(filename, fps, self.resolution)
+        elif filename.endswith(".png"):
+            self._encoder = _PngEncoder(filename)
+        else:
+            raise ValueError(f"Unsupported output format: {filename}")
+        self._queue = Queue(maxsize=queue_size)
+        self._errors = []
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.count = 0
+
+    def _run(self):
+        try:
+            while True:
+                fg = self._queue.get()
+                if fg is _DONE:
+                    break
+                with stage("render"):
+                    self._encoder.write(threshold_masks(fg, self.threshold).reshape(self.resolution))
+        except Exception as e:
+            self._errors.append(e)
+            # keep draining so that producers never block on a dead writer
+            while self._queue.get() is not _DONE:
+                pass
+        finally:
+            self._encoder.close()
+
+    def write(self, fg):
+        if self._errors:
+            raise self._errors[0]
+        self._queue.put(fg)
+        self.count += 1
+
+    def write_many(self, fgs):
+        for fg in fgs:
+            self.write(fg)
+
+    def __call__(self, index, res, fg):
+        # sink interface of run_pipeline
+        if fg is not None:
+            self.write(fg)
+
+    def close(self):
+        self._queue.put(_DONE)
+        self._thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()